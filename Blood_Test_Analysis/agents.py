@@ -10,6 +10,8 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Initialize LLM (Language Model) from Groq
+# Request rate is limited box-wide per LLM call (shared_state.groq_limiter,
+# applied in crew_runner), so the agents don't set their own max_rpm.
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 llm = ChatGroq(
     temperature=0.2,
@@ -40,7 +42,6 @@ doctor = Agent(
     tools=[ResearchSearchTool()],
     llm=llm,
     max_iter=2,
-    max_rpm=1,
     allow_delegation=True
 )
 
@@ -70,7 +71,6 @@ verifier = Agent(
     tools=[],
     llm=llm,
     max_iter=2,
-    max_rpm=1,
     allow_delegation=True
 )
 
@@ -98,7 +98,6 @@ nutritionist = Agent(
     tools=[NutritionSearchTool()],
     llm=llm,
     max_iter=2,
-    max_rpm=1,
     allow_delegation=True
 )
 
@@ -125,7 +124,6 @@ exercise_specialist = Agent(
     tools=[ExerciseSearchTool()],
     llm=llm,
     max_iter=2,
-    max_rpm=1,
     allow_delegation=False
 )
 
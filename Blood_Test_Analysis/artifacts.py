@@ -0,0 +1,174 @@
+# artifacts.py
+#
+# Compact on-disk store for everything derived from an uploaded report:
+# extracted pages, the structured lab table and the agent outputs.
+# Artifacts are msgpack documents compressed with zstd, stored under
+# ARTIFACT_DIR and keyed by the SHA-256 of the original PDF, so the same
+# file uploaded twice is parsed and stored only once.
+
+import contextlib
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+
+import msgpack
+import zstandard
+
+from lab_values import parse_lab_values
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "artifacts")
+ARTIFACT_VERSION = 1
+# Set ARTIFACT_KEEP_PDF=1 to also keep the original PDF next to its artifact
+KEEP_SOURCE_PDF = os.getenv("ARTIFACT_KEEP_PDF", "0") == "1"
+
+ZSTD_LEVEL = int(os.getenv("ARTIFACT_ZSTD_LEVEL", 10))
+
+# zstd (de)compressor objects must not be used by two threads at once, and the
+# API calls into this module from its thread pool: keep one pair per thread
+_zstd = threading.local()
+
+
+def _compressor() -> zstandard.ZstdCompressor:
+    if not hasattr(_zstd, "compressor"):
+        _zstd.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    return _zstd.compressor
+
+
+def _decompressor() -> zstandard.ZstdDecompressor:
+    if not hasattr(_zstd, "decompressor"):
+        _zstd.decompressor = zstandard.ZstdDecompressor()
+    return _zstd.decompressor
+
+
+# ------------------------------
+# Storage
+# ------------------------------
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _artifact_path(artifact_id: str) -> str:
+    # Two-level fan-out keeps directories small for large archives
+    return os.path.join(ARTIFACT_DIR, artifact_id[:2], f"{artifact_id}.msgpack.zst")
+
+
+def _source_path(artifact_id: str) -> str:
+    return os.path.join(ARTIFACT_DIR, artifact_id[:2], f"{artifact_id}.pdf")
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _write_artifact(artifact: dict) -> None:
+    packed = msgpack.packb(artifact, use_bin_type=True)
+    _write_atomic(_artifact_path(artifact["artifact_id"]), _compressor().compress(packed))
+
+
+def artifact_exists(artifact_id: str) -> bool:
+    return os.path.exists(_artifact_path(artifact_id))
+
+
+@contextlib.contextmanager
+def _artifact_lock(artifact_id: str):
+    """
+    Serialize load-modify-write of one artifact across threads and processes
+    (API uploads of the same file, reprocess.py), so no writer's results are lost.
+    """
+    path = _artifact_path(artifact_id) + ".lock"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def save_artifact(artifact_id: str, pages: list, file_name: str = None,
+                  results: dict = None, source: bytes = None) -> dict:
+    """
+    Store the extracted pages (and lab table) for a document. If the
+    document is already stored, only the agent results are updated.
+    """
+    with _artifact_lock(artifact_id):
+        artifact = load_artifact(artifact_id)
+        # The same content stored before is only rewritten to update its results
+        changed = artifact is None or results is not None
+        if artifact is None:
+            artifact = {
+                "version": ARTIFACT_VERSION,
+                "artifact_id": artifact_id,
+                "file_name": file_name,
+                "pages": pages,
+                "lab_values": parse_lab_values(pages),
+                "results": {},
+                "created_at": time.time(),
+            }
+        if results is not None:
+            artifact["results"] = results
+            artifact["updated_at"] = time.time()
+        if changed:
+            _write_artifact(artifact)
+
+    if source is not None and KEEP_SOURCE_PDF and not os.path.exists(_source_path(artifact_id)):
+        _write_atomic(_source_path(artifact_id), source)
+    return artifact
+
+
+def save_results(artifact_id: str, results: dict) -> None:
+    """
+    Replace the agent outputs stored for an existing artifact.
+    """
+    with _artifact_lock(artifact_id):
+        artifact = load_artifact(artifact_id)
+        if artifact is None:
+            raise KeyError(f"No artifact {artifact_id}")
+        artifact["results"] = results
+        artifact["updated_at"] = time.time()
+        _write_artifact(artifact)
+
+
+def load_artifact(artifact_id: str):
+    """
+    Memory-map the artifact file and decode it; returns None if it doesn't exist.
+    """
+    path = _artifact_path(artifact_id)
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return msgpack.unpackb(_decompressor().decompress(buf), raw=False)
+    except FileNotFoundError:
+        return None
+
+
+def iter_artifacts():
+    """
+    Yield every stored artifact id (used for bulk reprocessing).
+    """
+    if not os.path.isdir(ARTIFACT_DIR):
+        return
+    for shard in sorted(os.listdir(ARTIFACT_DIR)):
+        shard_dir = os.path.join(ARTIFACT_DIR, shard)
+        if not os.path.isdir(shard_dir):
+            continue
+        for name in sorted(os.listdir(shard_dir)):
+            if name.endswith(".msgpack.zst"):
+                yield name[:-len(".msgpack.zst")]
@@ -0,0 +1,147 @@
+# budget.py
+#
+# Per-request execution budget for run_crew_pipeline: total LLM calls, tool
+# calls, tokens and a wall-clock deadline across all agents. The crew runner
+# checks it between agents and after every agent step, and clamps each agent's
+# iterations to what is left; tools check it before every call.
+
+import contextvars
+import os
+import threading
+import time
+
+# Defaults per pipeline run; override in .env
+DEFAULT_MAX_LLM_CALLS = int(os.getenv("PIPELINE_MAX_LLM_CALLS", 12))
+DEFAULT_MAX_TOOL_CALLS = int(os.getenv("PIPELINE_MAX_TOOL_CALLS", 6))
+DEFAULT_MAX_TOKENS = int(os.getenv("PIPELINE_MAX_TOKENS", 40000))
+DEFAULT_DEADLINE_SECONDS = float(os.getenv("PIPELINE_DEADLINE_SECONDS", 180))
+
+# Budget of the pipeline running in the current context (read by the tools)
+current_budget = contextvars.ContextVar("current_budget", default=None)
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough 4-characters-per-token estimate, used until the real usage is known
+    return max(1, len(text or "") // 4)
+
+
+class BudgetExceeded(Exception):
+    """
+    Raised from an agent's step callback to stop it once the budget is spent.
+    """
+
+
+class ExecutionBudget:
+    """
+    Tracks usage against the limits and which agent spent what.
+    A limit of None means unlimited.
+    """
+
+    def __init__(self, max_llm_calls: int = DEFAULT_MAX_LLM_CALLS,
+                 max_tool_calls: int = DEFAULT_MAX_TOOL_CALLS,
+                 max_tokens: int = DEFAULT_MAX_TOKENS,
+                 deadline_seconds: float = DEFAULT_DEADLINE_SECONDS):
+        self.max_llm_calls = max_llm_calls
+        self.max_tool_calls = max_tool_calls
+        self.max_tokens = max_tokens
+        self.deadline_seconds = deadline_seconds
+        self.started = time.monotonic()
+        self.current_agent = None
+        self.by_agent = {}
+        self.skipped = []
+        self.exhausted_reason = None
+        self.exhausted_by = None
+        self.tools_exhausted_by = None
+        self._lock = threading.Lock()
+
+    # ------------------------------
+    # Usage
+    # ------------------------------
+    def _usage(self, role: str) -> dict:
+        return self.by_agent.setdefault(role, {"llm_calls": 0, "tool_calls": 0, "tokens": 0})
+
+    def _total(self, key: str) -> int:
+        return sum(usage[key] for usage in self.by_agent.values())
+
+    def charge_llm(self, role: str, calls: int, tokens: int = 0) -> None:
+        with self._lock:
+            usage = self._usage(role)
+            usage["llm_calls"] += calls
+            usage["tokens"] += tokens
+            self._check(role)
+
+    def try_charge_tool(self) -> bool:
+        """
+        Take one tool call from the budget; False if none are left.
+        """
+        role = self.current_agent or "unknown"
+        with self._lock:
+            if self._exceeded("tool_calls"):
+                if self.tools_exhausted_by is None:
+                    self.tools_exhausted_by = role
+                return False
+            self._usage(role)["tool_calls"] += 1
+            return True
+
+    # ------------------------------
+    # Limits
+    # ------------------------------
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining_seconds(self):
+        if self.deadline_seconds is None:
+            return None
+        return max(0.0, self.deadline_seconds - self.elapsed())
+
+    def remaining_llm_calls(self):
+        if self.max_llm_calls is None:
+            return None
+        return max(0, self.max_llm_calls - self._total("llm_calls"))
+
+    def _exceeded(self, key: str) -> bool:
+        limit = {"llm_calls": self.max_llm_calls, "tool_calls": self.max_tool_calls, "tokens": self.max_tokens}[key]
+        return limit is not None and self._total(key) >= limit
+
+    def _check(self, role: str) -> None:
+        # Remember the first limit hit and the agent that was running at the time
+        if self.exhausted_reason is not None:
+            return
+        for key in ["llm_calls", "tokens"]:
+            if self._exceeded(key):
+                self.exhausted_reason = key
+                self.exhausted_by = role
+                return
+
+    def exhausted(self):
+        """
+        Name of the exhausted limit (llm_calls, tokens, deadline), or None.
+        Running out of tool calls alone does not stop the pipeline.
+        """
+        with self._lock:
+            if self.exhausted_reason is None and self.remaining_seconds() == 0:
+                self.exhausted_reason = "deadline"
+                self.exhausted_by = self.current_agent
+            return self.exhausted_reason
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "limits": {
+                    "llm_calls": self.max_llm_calls,
+                    "tool_calls": self.max_tool_calls,
+                    "tokens": self.max_tokens,
+                    "deadline_seconds": self.deadline_seconds,
+                },
+                "used": {
+                    "llm_calls": self._total("llm_calls"),
+                    "tool_calls": self._total("tool_calls"),
+                    "tokens": self._total("tokens"),
+                    "elapsed_seconds": round(self.elapsed(), 3),
+                },
+                "by_agent": {role: dict(usage) for role, usage in self.by_agent.items()},
+                "exhausted": self.exhausted_reason,
+                "exhausted_by": self.exhausted_by,
+                "tool_calls_exhausted_by": self.tools_exhausted_by,
+                "skipped_agents": list(self.skipped),
+            }
@@ -1,4 +1,6 @@
 from celery import Celery
+from kombu import Queue
+from kombu.exceptions import ChannelError
 import os
 
 # Load environment variables from .env file
@@ -12,6 +14,7 @@ load_dotenv()
 # This acts as the entry point for defining and running asynchronous tasks
 celery_app = Celery(
     'tasks',  # Name of the app (can be any string)
+    include=['task'],  # Modules the worker imports to register the tasks
     broker=os.getenv(
         'CELERY_BROKER_URL',
         'redis://localhost:6379/0'  # Default to Redis if not set in .env
@@ -28,3 +31,71 @@ celery_app.conf.result_backend = os.getenv(
 # Optional: Set a time limit for how long results are kept
 # Helps avoid growing the backend indefinitely
 celery_app.conf.result_expires = 3600  # 1 hour expiration time
+
+# ------------------------------
+# Queues & Priorities
+# ------------------------------
+# Two lanes:
+# - "interactive": single reports a patient is waiting on
+# - "batch": bulk uploads (e.g. a clinic sending hundreds of reports)
+# Run a dedicated worker for the interactive lane so it never waits behind batch work
+# (from Blood_Test_Analysis/, since the app modules use top-level imports):
+#   celery -A celery_config.celery_app worker -Q interactive
+#   celery -A celery_config.celery_app worker -Q interactive,batch
+INTERACTIVE_QUEUE = "interactive"
+BATCH_QUEUE = "batch"
+
+# With the Redis broker 0 is the HIGHEST priority
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 5
+PRIORITY_BULK = 9
+
+celery_app.conf.task_queues = (
+    Queue(INTERACTIVE_QUEUE),
+    Queue(BATCH_QUEUE),
+)
+celery_app.conf.task_default_queue = BATCH_QUEUE
+celery_app.conf.task_default_priority = PRIORITY_NORMAL
+
+# Redis emulates priorities with one list per step; check them in priority order
+celery_app.conf.broker_transport_options = {
+    "priority_steps": list(range(10)),
+    "sep": ":",
+    "queue_order_strategy": "priority",
+}
+
+# Only reserve one task at a time, so priorities and tenant fairness are applied
+# when a task actually starts rather than when a worker prefetches a batch
+celery_app.conf.worker_prefetch_multiplier = 1
+celery_app.conf.task_acks_late = True
+
+# How long a task backs off when its tenant is already using its share of LLM slots
+TENANT_RETRY_SECONDS = int(os.getenv("TENANT_RETRY_SECONDS", 5))
+
+# Slots kept free for the interactive lane when batch work is running
+INTERACTIVE_RESERVED_SLOTS = int(os.getenv("INTERACTIVE_RESERVED_SLOTS", 1))
+
+# The lane is decided server-side from volume: a tenant that submits more than
+# INTERACTIVE_MAX_PER_WINDOW reports within INTERACTIVE_WINDOW_SECONDS is a bulk
+# sender and its further reports go to the batch lane
+INTERACTIVE_MAX_PER_WINDOW = int(os.getenv("INTERACTIVE_MAX_PER_WINDOW", 3))
+INTERACTIVE_WINDOW_SECONDS = int(os.getenv("INTERACTIVE_WINDOW_SECONDS", 600))
+
+
+def get_queue_depths() -> dict:
+    """
+    Number of messages waiting in each queue (all priority steps included);
+    None if the broker could not be asked.
+    """
+    depths = {}
+    with celery_app.connection_for_read() as conn:
+        channel = conn.default_channel
+        for queue in celery_app.conf.task_queues:
+            try:
+                depths[queue.name] = channel.queue_declare(queue=queue.name, passive=True).message_count
+            except ChannelError:
+                # The Redis transport has no keys for a queue until a message is sent to it
+                depths[queue.name] = 0
+            except Exception:
+                depths[queue.name] = None
+    return depths
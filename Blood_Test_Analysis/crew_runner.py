@@ -2,23 +2,187 @@
 
 from crewai import Crew
 from agents import verifier, doctor, nutritionist, exercise_specialist
-from task import verification, help_patients, nutrition_analysis, exercise_planning
+from task import (
+    verification,
+    help_patients,
+    nutrition_analysis,
+    exercise_planning,
+    follow_up_doctor,
+    follow_up_nutrition,
+    follow_up_exercise,
+)
 from tools.tools import BloodTestReportTool
+from shared_state import groq_limiter
+from budget import ExecutionBudget, BudgetExceeded, current_budget, estimate_tokens
+import contextlib
 import logging
+import re
 import time
 
 logger = logging.getLogger(__name__)
 
-def run_crew_pipeline(query: str, file_path: str) -> dict:
-    # 1) Extract PDF text once at the top level
+# Keep the earlier analysis passed to follow-ups within the model's context budget
+MAX_PRIOR_CHARS = 4000
+
+# Keywords used to route a follow-up question to the one relevant specialist
+FOLLOW_UP_ROUTES = [
+    (re.compile(r"\b(diet|food|eat|eating|meal|nutrition|supplement|vitamin|drink)", re.I),
+     follow_up_nutrition, nutritionist),
+    (re.compile(r"\b(exercise|workout|training|gym|run|running|walk|sport|fitness|cardio)", re.I),
+     follow_up_exercise, exercise_specialist),
+]
+
+
+def _acquire_llm_call(budget: ExecutionBudget) -> None:
+    """
+    Take one call from the box-wide Groq quota, waiting no longer than the deadline.
+    """
+    if budget.remaining_seconds() == 0:
+        # acquire(timeout=0) would still succeed while the bucket has tokens
+        budget.exhausted()
+        raise BudgetExceeded("deadline budget exhausted")
+    if not groq_limiter.acquire(timeout=budget.remaining_seconds()):
+        raise BudgetExceeded("deadline budget exhausted while waiting for the Groq quota")
+
+
+@contextlib.contextmanager
+def _agent_limits(agent, budget: ExecutionBudget, prompt_tokens: int = 0):
+    """
+    Fit one agent into what is left of the budget for the duration of its step:
+    clamp max_iter and count every LLM step (with an estimate of its tokens) so
+    the agent can be stopped once the budget is spent. (Delegation needs coworkers
+    in the same Crew; each step runs in a one-agent Crew, so allow_delegation
+    never adds calls here.)
+
+    Yields the list of token estimates charged, so the caller can replace them
+    with the real usage afterwards.
+    """
+    saved = (agent.max_iter, agent.max_retry_limit, agent.step_callback, agent.tools)
+    remaining = budget.remaining_llm_calls()
+    if remaining is not None:
+        # crewai makes one extra call to force a final answer after max_iter
+        agent.max_iter = max(1, min(agent.max_iter, remaining - 1))
+    if budget.max_tool_calls == 0:
+        # A task without tools falls back to the agent's own; with no tool calls
+        # allowed, offer none so the agent answers straight away
+        agent.tools = []
+    # crewai re-runs a failed task max_retry_limit times; a BudgetExceeded must end it
+    agent.max_retry_limit = 0
+    estimates = []
+
+    def on_step(step):
+        tokens = prompt_tokens + estimate_tokens(str(getattr(step, "text", "") or ""))
+        estimates.append(tokens)
+        budget.charge_llm(agent.role, 1, tokens)
+        # AgentFinish has no tool and is the last step: let a final answer through
+        # even when it used up the budget. Any other step is followed by another call.
+        if not hasattr(step, "tool"):
+            return
+        reason = budget.exhausted()
+        if reason:
+            raise BudgetExceeded(f"{reason} budget exhausted")
+        _acquire_llm_call(budget)
+
+    agent.step_callback = on_step
+    budget.current_agent = agent.role
     try:
-        loader = BloodTestReportTool()
-        pdf_text = getattr(loader, "run", loader._run)(file_path)
-    except Exception as e:
-        logger.exception("PDF extraction failed")
-        return {"error": f"Error extracting PDF: {e}"}
+        yield estimates
+    finally:
+        agent.max_iter, agent.max_retry_limit, agent.step_callback, agent.tools = saved
+        budget.current_agent = None
+
+
+def _run_step(task, agent, inputs: dict, stats: dict = None, budget: ExecutionBudget = None) -> str:
+    budget = budget or ExecutionBudget()
+    # The budget may have run out while this run waited (e.g. for its LLM slot)
+    reason = budget.exhausted()
+    if reason:
+        raise BudgetExceeded(f"{reason} budget exhausted")
+    # Every call resends the task prompt and the report, so count them per step
+    prompt_tokens = estimate_tokens(task.description + "".join(str(v) for v in inputs.values()))
+    # The agents and tasks are module-level; run on copies so _agent_limits and
+    # crewai's input interpolation never touch state shared with concurrent runs
+    agent = agent.copy()
+    task = task.copy([agent], {})
+    with _agent_limits(agent, budget, prompt_tokens) as estimates:
+        # spin up a one-agent, one-task Crew each time
+        crew = Crew(agents=[agent], tasks=[task], process="sequential")
+        _acquire_llm_call(budget)  # first LLM call; later calls are taken in on_step
+
+        started = time.perf_counter()
+        try:
+            out = crew.kickoff(inputs).dict()
+        finally:
+            if stats is not None:
+                # Per-agent latency and tool-call counts
+                stats[agent.role] = {
+                    "latency_seconds": round(time.perf_counter() - started, 3),
+                    "tool_calls": getattr(task, "used_tools", 0) or 0,
+                }
+
+    usage = out.get("token_usage") or {}
+    if usage.get("total_tokens"):
+        # Replace the per-step estimates with the real usage
+        budget.charge_llm(agent.role, 0, usage["total_tokens"] - sum(estimates))
+
+    if stats is not None:
+        stats[agent.role].update({
+            "llm_calls": usage.get("successful_requests", 0),
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "total_tokens": usage.get("total_tokens", 0),
+        })
+
+    raw = (out.get("tasks_output") or [{}])[0].get("raw", "").strip()
+    return raw or "⚠️ No output."
+
+
+def strip_urls(text: str) -> str:
+    """
+    Removes URLs from a string.
+    """
+    if isinstance(text, str):
+        return re.sub(r"https?://\S+", "", text)
+    return text
+
+
+def clean_analysis(analysis: dict) -> dict:
+    """
+    Clean agent analysis results:
+      - Replace None with fallback text
+      - Strip URLs
+    """
+    cleaned = {}
+    for key, value in analysis.items():
+        if value is None:
+            cleaned[key] = "⚠️ No analysis returned from agent."
+        else:
+            cleaned[key] = strip_urls(value)
+    return cleaned
 
-    inputs = {"query": query, "report_text": pdf_text}
+
+def run_crew_pipeline(query: str, file_path: str = None, report_text: str = None,
+                      stats: dict = None, budget: ExecutionBudget = None) -> dict:
+    """
+    Run the four agents over one report. Pass a dict as `stats` to collect
+    per-agent latency, LLM calls, token usage and tool calls.
+
+    All agents share one ExecutionBudget (LLM calls, tool calls, tokens, deadline;
+    defaults from budget.py). Once it runs out the remaining agents are skipped and
+    the results gathered so far are returned; `budget.report()` shows who spent it.
+    """
+    budget = budget or ExecutionBudget()
+
+    # 1) Extract PDF text once at the top level (unless the caller already did)
+    if report_text is None:
+        try:
+            loader = BloodTestReportTool()
+            report_text = getattr(loader, "run", loader._run)(file_path)
+        except Exception as e:
+            logger.exception("PDF extraction failed")
+            return {"error": f"Error extracting PDF: {e}"}
+
+    inputs = {"query": query, "report_text": report_text}
     pipeline = [
         (verification, verifier),
         (help_patients, doctor),
@@ -27,17 +191,83 @@ def run_crew_pipeline(query: str, file_path: str) -> dict:
     ]
 
     results = {}
-    for task, agent in pipeline:
-        role = agent.role
-        try:
-            # spin up a one-agent, one-task Crew each time
-            crew = Crew(agents=[agent], tasks=[task], process="sequential")
-            time.sleep(1)  # throttle to avoid TPM spikes
-            out = crew.kickoff(inputs).dict()
-            raw = (out.get("tasks_output") or [{}])[0].get("raw", "").strip()
-            results[role] = raw or "⚠️ No output."
-        except Exception as e:
-            logger.warning(f"{role} step failed: {e}")
-            results[role] = f"⚠️ Error in {role}: {e}"
+    token = current_budget.set(budget)
+    try:
+        for task, agent in pipeline:
+            role = agent.role
+            reason = budget.exhausted()
+            if reason:
+                logger.warning(f"Skipping {role}: {reason} budget exhausted")
+                budget.skipped.append(role)
+                results[role] = f"⚠️ Skipped {role}: execution budget exhausted ({reason})."
+                continue
+            try:
+                results[role] = _run_step(task, agent, inputs, stats, budget)
+            except BudgetExceeded as e:
+                logger.warning(f"{role} stopped: {e}")
+                results[role] = f"⚠️ {role} stopped early: {e}."
+            except Exception as e:
+                logger.warning(f"{role} step failed: {e}")
+                results[role] = f"⚠️ Error in {role}: {e}"
+    finally:
+        current_budget.reset(token)
 
+    logger.info(f"Pipeline budget usage: {budget.report()['used']}")
     return results
+
+
+def select_follow_up(query: str):
+    """
+    Pick the (task, agent) pair for a follow-up question; defaults to the doctor.
+    """
+    for pattern, task, agent in FOLLOW_UP_ROUTES:
+        if pattern.search(query):
+            return task, agent
+    return follow_up_doctor, doctor
+
+
+def format_prior_analysis(prior: dict, follow_ups: list = None) -> str:
+    """
+    Render earlier agent outputs (and recent follow-ups) as context for the next question.
+    """
+    sections = [f"### {role}\n{output}" for role, output in prior.items()]
+    for item in (follow_ups or [])[-3:]:
+        sections.append(f"### Earlier question: {item.get('query')}\n{item.get('answer')}")
+    text = "\n\n".join(sections)
+    if len(text) > MAX_PRIOR_CHARS:
+        text = text[:MAX_PRIOR_CHARS] + "\n\n[...TRUNCATED...]"
+    return text
+
+
+def follow_up_budget() -> ExecutionBudget:
+    """
+    Budget for one follow-up answer: a single LLM call and no tool calls.
+    """
+    return ExecutionBudget(max_llm_calls=1, max_tool_calls=0)
+
+
+def run_follow_up(query: str, report_text: str, prior: dict, follow_ups: list = None,
+                  budget: ExecutionBudget = None) -> tuple:
+    """
+    Answer a follow-up question with a single agent and a single LLM call,
+    reusing the stored report text and earlier analysis instead of re-running
+    the whole pipeline. Returns (agent role, answer).
+    """
+    task, agent = select_follow_up(query)
+    inputs = {
+        "query": query,
+        "report_text": report_text,
+        "prior_analysis": format_prior_analysis(prior, follow_ups),
+    }
+    budget = budget or follow_up_budget()
+    token = current_budget.set(budget)
+    try:
+        return agent.role, _run_step(task, agent, inputs, budget=budget)
+    except BudgetExceeded as e:
+        logger.warning(f"{agent.role} follow-up stopped: {e}")
+        return agent.role, f"⚠️ {agent.role} stopped early: {e}."
+    except Exception as e:
+        logger.warning(f"{agent.role} follow-up failed: {e}")
+        return agent.role, f"⚠️ Error in {agent.role}: {e}"
+    finally:
+        current_budget.reset(token)
@@ -12,7 +12,9 @@ DB_NAME = "blood_report_test_db"
 # CHANGED:
 # Create an asynchronous MongoDB client using Motor.
 # Motor integrates seamlessly with async frameworks like FastAPI.
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
+# connect=False defers connecting until first use, so the client is safe to
+# create in the gunicorn master before workers are forked (preload_app).
+client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI, connect=False)
 
 # Access the specific database
 db = client[DB_NAME]
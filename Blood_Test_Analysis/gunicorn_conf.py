@@ -0,0 +1,76 @@
+# gunicorn_conf.py
+#
+# Production launch profile for the FastAPI app:
+#   gunicorn -c gunicorn_conf.py main:app
+# or
+#   APP_ENV=production python main.py
+
+import logging
+import multiprocessing
+import os
+
+from shared_state import init_shared_state
+
+logger = logging.getLogger("gunicorn.error")
+
+# ------------------------------
+# Server Socket
+# ------------------------------
+bind = f"0.0.0.0:{os.getenv('PORT', 8000)}"
+
+# ------------------------------
+# Worker Processes
+# ------------------------------
+# Default to (2 x cores) + 1; override with WEB_CONCURRENCY
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the app once in the master so workers fork with it already loaded
+preload_app = True
+
+# Analyses can take minutes; give in-flight requests time to finish on shutdown and
+# on max_requests recycling. The default covers the longest /analyze: waiting for an
+# LLM slot (main.py), OCR (tools/ocr.py) and the pipeline deadline (budget.py).
+_longest_analysis = (
+    float(os.getenv("ANALYZE_SLOT_WAIT_SECONDS", 30))
+    + float(os.getenv("OCR_DOC_TIMEOUT", 180))
+    + float(os.getenv("PIPELINE_DEADLINE_SECONDS", 180))
+)
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", _longest_analysis + 30))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", max(300, graceful_timeout)))
+keepalive = 5
+
+# Recycle workers periodically to cap memory growth from long-lived agents
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 500))
+max_requests_jitter = 50
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+# ------------------------------
+# Server Hooks
+# ------------------------------
+def on_starting(server):
+    # Create the shared SQLite state (quotas, caches) before any worker starts
+    init_shared_state()
+
+
+def post_fork(server, worker):
+    logger.info(f"Worker spawned (pid: {worker.pid})")
+
+
+def worker_int(worker):
+    # SIGINT / SIGQUIT: immediate shutdown, in-flight requests are dropped
+    logger.warning(f"Worker {worker.pid} interrupted, shutting down without draining")
+
+
+def worker_exit(server, worker):
+    # After a graceful stop (SIGTERM, max_requests recycling) in-flight requests have
+    # been drained (or graceful_timeout ran out) by the time this runs
+    logger.info(f"Worker {worker.pid} exited")
+
+
+def on_exit(server):
+    logger.info("All workers stopped, shutting down")
@@ -0,0 +1,81 @@
+# lab_values.py
+#
+# Structured lab table parsed from the extracted report text: one row per
+# test with its value, unit, reference range and an L/N/H flag. A line only
+# counts as a result if it has a reference range or a known lab unit, so
+# headers such as "Patient ID 123456" or "Collected on 12/05/2023" are skipped.
+
+import re
+
+# Matches lines such as "Hemoglobin 13.5 g/dL 13.0 - 17.0"
+LAB_LINE_RE = re.compile(
+    r"^(?P<name>[A-Za-z][A-Za-z0-9 ()/,.%+\-]*?)\s*:?\s+"
+    # A number directly followed by "/", ":" or another number is a date or time, not a value
+    r"(?P<value>[<>]?\d+(?:\.\d+)?)(?![\d/:])\s*"
+    r"(?P<unit>(?:10\^\d+/?[A-Za-zµμ]*|[A-Za-z%µμ/^*]+[A-Za-z0-9%µμ/^*.]*)?)\s*"
+    r"(?:(?P<low>\d+(?:\.\d+)?)\s*(?:-|–|to)\s*(?P<high>\d+(?:\.\d+)?))?"
+)
+
+# Units seen on common blood panels (compared lower-cased, with µ/μ written as u)
+KNOWN_UNITS = {
+    "%", "g/dl", "g/l", "mg/dl", "mg/l", "ug/dl", "ug/l", "ng/ml", "ng/dl", "pg/ml", "pg", "fl",
+    "mmol/l", "umol/l", "nmol/l", "pmol/l", "meq/l", "u/l", "iu/l", "miu/l", "uiu/ml", "miu/ml",
+    "mm/hr", "mm/h", "sec", "s", "ratio",
+    "/ul", "/cumm", "/mm3", "cells/ul", "cells/mcl", "cumm", "mill/cumm", "million/cumm",
+    "lakhs/cumm", "lakh/cumm", "thou/mm3", "thou/ul",
+    "10^3/ul", "10^6/ul", "10^9/l", "10^12/l",
+}
+
+# Line prefixes that carry a number but are never a lab result
+SKIP_PREFIXES = ("page", "date", "age", "name", "patient", "lab no", "sample", "ref")
+
+
+def _normalise_unit(unit: str) -> str:
+    return unit.lower().replace("µ", "u").replace("μ", "u").rstrip(".")
+
+
+def parse_lab_line(line: str):
+    """
+    Parse one line into a lab row, or None if it doesn't look like a result.
+    """
+    match = LAB_LINE_RE.match(line.strip())
+    if not match:
+        return None
+    name = match.group("name").strip(" :.-")
+    if len(name) < 2 or name.lower().startswith(SKIP_PREFIXES):
+        return None
+
+    unit = match.group("unit") or None
+    low, high = match.group("low"), match.group("high")
+    has_range = low is not None and high is not None
+    if not has_range and (unit is None or _normalise_unit(unit) not in KNOWN_UNITS):
+        return None
+
+    value = float(match.group("value").lstrip("<>"))
+    flag = None
+    if has_range:
+        low, high = float(low), float(high)
+        flag = "L" if value < low else "H" if value > high else "N"
+
+    return {
+        "name": name,
+        "value": value,
+        "unit": unit,
+        "ref_low": low,
+        "ref_high": high,
+        "flag": flag,
+    }
+
+
+def parse_lab_values(pages: list) -> list:
+    """
+    Pull rows of (name, value, unit, reference range, flag) out of the report text.
+    Lines that don't look like a lab result are skipped.
+    """
+    rows = []
+    for page in pages:
+        for line in page.splitlines():
+            row = parse_lab_line(line)
+            if row is not None:
+                rows.append(row)
+    return rows
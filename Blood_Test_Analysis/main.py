@@ -10,17 +10,25 @@ import logging
 import os
 import uuid
 import json
-import re
 from datetime import datetime
 
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
 from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 import pdfplumber
 
-from crew_runner import run_crew_pipeline
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from crew_runner import run_crew_pipeline, run_follow_up, follow_up_budget, strip_urls, clean_analysis
+from budget import ExecutionBudget
 from database import reports_collection
-from Blood_Test_Analysis.tools.tools import BloodTestReportTool
+from celery_config import celery_app, get_queue_depths, INTERACTIVE_QUEUE, INTERACTIVE_RESERVED_SLOTS
+from shared_state import llm_slots, queue_wait_stats
+from task import submit_analysis, choose_lane
+from artifacts import content_hash, load_artifact, save_artifact, save_results
+from tools.tools import extract_pdf_pages, format_report_text
 
 # ------------------------------
 # Logging Configuration
@@ -52,6 +60,15 @@ app.add_middleware(
 data_dir = os.getenv("DATA_DIR", "data")
 os.makedirs(data_dir, exist_ok=True)
 
+# API keys issued to clinics/partners, as "key1:tenant-a,key2:tenant-b".
+# Requests without a known key are grouped by client address.
+TENANT_API_KEYS = dict(
+    pair.split(":", 1) for pair in os.getenv("TENANT_API_KEYS", "").split(",") if ":" in pair
+)
+
+# How long /analyze waits for a free LLM slot before answering 429
+ANALYZE_SLOT_WAIT_SECONDS = float(os.getenv("ANALYZE_SLOT_WAIT_SECONDS", 30))
+
 # ------------------------------
 # Helpers
 # ------------------------------
@@ -71,33 +88,38 @@ def extract_user_name_from_pdf(file_path: str) -> str:
         logger.warning(f"Failed to extract name from PDF: {e}")
     return "Unknown User"
 
-def strip_urls(text: str) -> str:
+def resolve_tenant(request: Request) -> str:
     """
-    Removes URLs from a string.
+    Tenant used for fair scheduling, derived on the server (never from a form field).
     """
-    if isinstance(text, str):
-        return re.sub(r"https?://\S+", "", text)
-    return text
+    api_key = request.headers.get("x-api-key")
+    if api_key and api_key in TENANT_API_KEYS:
+        return TENANT_API_KEYS[api_key]
+    return f"ip:{request.client.host if request.client else 'unknown'}"
 
-def clean_analysis(analysis: dict) -> dict:
+def load_or_extract_artifact(artifact_id: str, file_path: str, file_name: str, content: bytes) -> dict:
     """
-    Clean agent analysis results:
-      - Replace None with fallback text
-      - Strip URLs
+    Return the stored artifact for this file, extracting and storing it on first sight.
+    If OCR failed on any page the extraction is returned unsaved (artifact_id None),
+    so the next upload of the file tries again.
     """
-    cleaned = {}
-    for key, value in analysis.items():
-        if value is None:
-            cleaned[key] = "⚠️ No analysis returned from agent."
-        else:
-            cleaned[key] = strip_urls(value)
-    return cleaned
+    artifact = load_artifact(artifact_id)
+    if artifact is None:
+        pages, incomplete = extract_pdf_pages(file_path)
+        if incomplete:
+            logger.warning(f"OCR incomplete for page(s) {[n + 1 for n in incomplete]} of {file_name}; not storing artifact")
+            return {"artifact_id": None, "pages": pages}
+        artifact = save_artifact(artifact_id, pages, file_name=file_name, source=content)
+    else:
+        logger.info(f"Reusing stored artifact {artifact_id}")
+    return artifact
 
 # ------------------------------
 # API Endpoint
 # ------------------------------
 @app.post("/analyze")
 async def analyze_endpoint(
+    request: Request,
     file: UploadFile = File(...),
     query: str = Form(default="Summarize my Blood Test Report")
 ) -> JSONResponse:
@@ -113,23 +135,58 @@ async def analyze_endpoint(
         f.write(content)
 
     # 3) Extract user name
-    user_name = extract_user_name_from_pdf(tmp_path)
+    # Blocking work (PDF parsing, OCR, the crew pipeline and its rate-limit waits)
+    # runs in the thread pool so the event loop keeps serving other requests
+    user_name = await run_in_threadpool(extract_user_name_from_pdf, tmp_path)
     logger.info(f"Processing report for user: {user_name}")
 
+    # Artifacts are keyed by file content, so a re-uploaded report isn't parsed again
+    artifact_id = content_hash(content)
+
+    # The inline pipeline takes a slot from the same pool as the Celery jobs,
+    # so per-tenant caps and the interactive reservation apply here too
+    tenant_id = resolve_tenant(request)
+    queue, _ = await run_in_threadpool(choose_lane, tenant_id)
+    reserve = 0 if queue == INTERACTIVE_QUEUE else INTERACTIVE_RESERVED_SLOTS
+    slot_acquired = False
+
     try:
-        # 4) Extract text via BloodTestReportTool
-        tool = BloodTestReportTool()
-        pdf_text = tool.run(tmp_path)
+        slot_acquired = await run_in_threadpool(
+            llm_slots.acquire, tenant_id, file_id, reserve=reserve, timeout=ANALYZE_SLOT_WAIT_SECONDS
+        )
+        if not slot_acquired:
+            raise HTTPException(
+                429,
+                "Too many analyses in progress for this account; please retry shortly.",
+                headers={"Retry-After": str(int(ANALYZE_SLOT_WAIT_SECONDS))}
+            )
+
+        # 4) Extract text (or reuse the pages stored for this exact file)
+        artifact = await run_in_threadpool(
+            load_or_extract_artifact, artifact_id, tmp_path, file.filename, content
+        )
+        pdf_text = format_report_text(artifact["pages"])
         logger.info(f"Extracted PDF text length: {len(pdf_text)} characters")
+        if not pdf_text.strip():
+            raise HTTPException(422, "No text could be extracted from the PDF.")
 
         # 5) Run Crew pipeline
-        analysis = run_crew_pipeline(query.strip(), pdf_text)
+        budget = ExecutionBudget()
+        analysis = await run_in_threadpool(
+            run_crew_pipeline, query.strip(), report_text=pdf_text, budget=budget
+        )
+
+    except HTTPException:
+        raise
 
     except Exception as e:
         logger.exception("Error during report analysis")
         raise HTTPException(500, f"Failed to analyze report: {e}")
 
     finally:
+        if slot_acquired:
+            await run_in_threadpool(llm_slots.release, file_id)
+
         # 6) Clean up temp file
         try:
             os.remove(tmp_path)
@@ -138,7 +195,13 @@ async def analyze_endpoint(
 
     # 7) Clean and serialize analysis
     cleaned_analysis = clean_analysis(analysis)
-    analysis_str = json.dumps(cleaned_analysis, ensure_ascii=False, indent=2)
+    analysis_str = json.dumps(cleaned_analysis, ensure_ascii=False, separators=(",", ":"))
+    stored_artifact_id = artifact.get("artifact_id")
+    if stored_artifact_id:
+        try:
+            await run_in_threadpool(save_results, stored_artifact_id, cleaned_analysis)
+        except Exception:
+            logger.exception("Failed to store agent outputs in artifact")
 
     # 8) Persist result to MongoDB
     report_id = None
@@ -147,6 +210,13 @@ async def analyze_endpoint(
             "user_name": user_name,
             "query": query,
             "analysis": analysis_str,
+            # Extracted pages live in the artifact store, so follow-ups and
+            # reprocessing don't need a re-upload or re-parse. Without an
+            # artifact (OCR incomplete) the text is kept on the report instead.
+            "artifact_id": stored_artifact_id,
+            "report_text": None if stored_artifact_id else pdf_text,
+            "follow_ups": [],
+            "budget": budget.report(),
             "original_file_name": file.filename,
             "created_at": datetime.utcnow()
         }
@@ -163,14 +233,159 @@ async def analyze_endpoint(
             "user_name": user_name,
             "query": query,
             "analysis": cleaned_analysis,
+            "budget": budget.report(),
             "report_id": report_id
         }
     )
 
+@app.post("/reports/{report_id}/ask")
+async def ask_endpoint(
+    report_id: str,
+    query: str = Form(...)
+) -> JSONResponse:
+    """
+    Answer a follow-up question about a stored report with a single agent,
+    reusing the extracted text and the earlier analysis.
+    """
+    # 1) Validate input
+    if not query.strip():
+        raise HTTPException(400, "Query must not be empty.")
+    try:
+        oid = ObjectId(report_id)
+    except InvalidId:
+        raise HTTPException(400, "Invalid report id.")
+
+    # 2) Load the stored report
+    doc = await reports_collection.find_one({"_id": oid})
+    if doc is None:
+        raise HTTPException(404, "Report not found.")
+    report_text = doc.get("report_text")
+    if not report_text and doc.get("artifact_id"):
+        artifact = await run_in_threadpool(load_artifact, doc["artifact_id"])
+        if artifact is not None:
+            report_text = format_report_text(artifact["pages"])
+    if not report_text:
+        raise HTTPException(409, "This report was stored without its text; please upload it again via /analyze.")
+
+    prior = json.loads(doc.get("analysis") or "{}")
+
+    # 3) Run only the relevant agent
+    try:
+        budget = follow_up_budget()
+        agent_role, answer = await run_in_threadpool(
+            run_follow_up, query.strip(), report_text, prior, doc.get("follow_ups"), budget=budget
+        )
+    except Exception as e:
+        logger.exception("Error answering follow-up")
+        raise HTTPException(500, f"Failed to answer follow-up: {e}")
+    answer = strip_urls(answer)
+
+    # 4) Append to the report's follow-up history
+    try:
+        await reports_collection.update_one(
+            {"_id": oid},
+            {"$push": {"follow_ups": {
+                "query": query,
+                "agent": agent_role,
+                "answer": answer,
+                "created_at": datetime.utcnow()
+            }}}
+        )
+    except Exception:
+        logger.exception("Failed to save follow-up to MongoDB")
+
+    return JSONResponse(
+        status_code=200,
+        content={
+            "status": "success",
+            "report_id": report_id,
+            "query": query,
+            "agent": agent_role,
+            "answer": answer,
+            "budget": budget.report()
+        }
+    )
+
+# ------------------------------
+# Background Jobs
+# ------------------------------
+@app.post("/jobs")
+async def submit_job_endpoint(
+    request: Request,
+    file: UploadFile = File(...),
+    query: str = Form(default="Summarize my Blood Test Report"),
+    bulk: bool = Form(default=False)
+) -> JSONResponse:
+    """
+    Queue a report for background analysis.
+    The tenant and lane are decided by the server: single uploads use the
+    interactive lane, high-volume senders are moved to the batch lane.
+    `bulk` can only lower the priority.
+    """
+    tenant_id = resolve_tenant(request)
+    if not file.filename.lower().endswith(".pdf"):
+        raise HTTPException(400, "Only PDF files are supported.")
+
+    # The worker removes the file once the job has run
+    file_id = uuid.uuid4().hex
+    tmp_path = os.path.join(data_dir, f"blood_test_report_{file_id}.pdf")
+    content = await file.read()
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+
+    job = await run_in_threadpool(
+        submit_analysis, os.path.abspath(tmp_path), query.strip(), tenant_id=tenant_id, bulk=bulk
+    )
+    logger.info(f"Queued job {job.id} for tenant {tenant_id} (bulk={bulk})")
+
+    return JSONResponse(
+        status_code=202,
+        content={"status": "queued", "job_id": job.id, "tenant_id": tenant_id}
+    )
+
+# Plain `def`: FastAPI runs these in the thread pool, so broker/backend I/O
+# doesn't block the event loop
+@app.get("/jobs/{job_id}")
+def job_status_endpoint(job_id: str) -> JSONResponse:
+    job = celery_app.AsyncResult(job_id)
+    content = {"job_id": job_id, "state": job.state}
+    if job.ready():
+        content["result"] = job.result if job.successful() else str(job.result)
+    return JSONResponse(status_code=200, content=content)
+
+@app.get("/metrics/queues")
+def queue_metrics_endpoint() -> JSONResponse:
+    """
+    Queue depth, recent wait times and LLM slot usage per tenant.
+    """
+    try:
+        depths = get_queue_depths()
+    except Exception as e:
+        logger.warning(f"Failed to read queue depths: {e}")
+        depths = {}
+
+    return JSONResponse(
+        status_code=200,
+        content={
+            "queue_depth": depths,
+            "wait_time": queue_wait_stats(),
+            "llm_slots": {
+                "capacity": llm_slots.capacity,
+                "per_tenant": llm_slots.per_owner,
+                "in_use": llm_slots.usage(),
+            },
+        }
+    )
+
 # ------------------------------
 # Local Run
 # ------------------------------
 if __name__ == "__main__":
+    # APP_ENV=production starts the gunicorn worker pool (see gunicorn_conf.py)
+    if os.getenv("APP_ENV", "development") == "production":
+        conf_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn_conf.py")
+        os.execvp("gunicorn", ["gunicorn", "-c", conf_path, "main:app"])
+
     import uvicorn
     uvicorn.run(
         "main:app",
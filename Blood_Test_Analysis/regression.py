@@ -0,0 +1,430 @@
+# regression.py
+#
+# Offline quality/latency regression harness for prompt and model changes.
+# Runs a fixed corpus of reports through run_crew_pipeline under a baseline and a
+# candidate configuration, with recorded or fake LLM and search responses, and
+# compares per-agent latency, token usage, tool calls and output agreement.
+#
+#   python regression.py --corpus ../data --baseline base.json --candidate cand.json
+#
+# A configuration file overrides agent and task attributes by their variable
+# names in agents.py / task.py, and may point at a recordings file:
+#
+#   {
+#     "name": "fewer-iterations",
+#     "agents": {"doctor": {"max_iter": 1, "allow_delegation": false}},
+#     "tasks": {"help_patients": {"description": "..."}},
+#     "recordings": "recordings/baseline.json"
+#   }
+#
+# Recordings map an agent role to the responses it returns, in call order:
+#
+#   {"Blood Report Verifier": ["Thought: ...\nFinal Answer: Yes ...",
+#                              {"response": "...", "latency": 0.8}]}
+#
+# Roles without recordings get a fake "Final Answer" built from the report's lab table.
+# Their latency and tool calls say nothing about the change, so the latency and
+# tool-call thresholds only cover roles recorded in both configurations.
+# The process exits with status 1 when the candidate breaches a threshold.
+
+import argparse
+import contextlib
+import difflib
+import json
+import logging
+import os
+import re
+import statistics
+import sys
+import time
+
+from crewai.llms.base_llm import BaseLLM
+
+import agents
+import crew_runner
+import task as tasks_module
+import tools.tools
+from budget import estimate_tokens
+from artifacts import content_hash, load_artifact, save_artifact
+from lab_values import parse_lab_values
+from tools.tools import extract_pdf_pages, format_report_text
+
+logging.basicConfig(level=logging.INFO)
+logging.getLogger("crewai").setLevel(logging.WARNING)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger("regression")
+
+AGENT_NAMES = ["verifier", "doctor", "nutritionist", "exercise_specialist"]
+TASK_NAMES = ["verification", "help_patients", "nutrition_analysis", "exercise_planning"]
+
+
+# ------------------------------
+# Fake LLM & Search
+# ------------------------------
+class ReplayLLM(BaseLLM):
+    """
+    LLM stand-in that replays recorded responses for one agent (or fakes one),
+    counting calls and estimated tokens.
+    """
+
+    def __init__(self, role: str, responses: list = None, fallback: str = ""):
+        super().__init__(model=f"replay/{role}")
+        self.role = role
+        self.responses = list(responses or [])
+        self.fallback = fallback
+        # A dict so the copies crew_runner makes of each agent (and its LLM) share the counters
+        self.usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+        prompt = messages if isinstance(messages, str) else "\n".join(
+            str(m.get("content", "")) for m in messages
+        )
+
+        if self.usage["calls"] < len(self.responses):
+            entry = self.responses[self.usage["calls"]]
+        else:
+            entry = self.fallback
+        if isinstance(entry, dict):
+            time.sleep(entry.get("latency", 0))
+            response = entry["response"]
+        else:
+            response = entry
+
+        self.usage["calls"] += 1
+        self.usage["prompt_tokens"] += estimate_tokens(prompt)
+        self.usage["completion_tokens"] += estimate_tokens(response)
+        return response
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def reset(self) -> None:
+        self.usage.update(calls=0, prompt_tokens=0, completion_tokens=0)
+
+
+def fake_answer(role: str, lab_values: list) -> str:
+    abnormal = [row for row in lab_values if row["flag"] in ("H", "L")]
+    if role == agents.verifier.role:
+        body = "Yes, this is a blood test report." if lab_values else "No, this is not a blood test report."
+    else:
+        lines = [f"- {row['name']}: {row['value']} ({'high' if row['flag'] == 'H' else 'low'})" for row in abnormal]
+        body = "Findings:\n" + ("\n".join(lines) if lines else "- All values are within the normal range.")
+    return f"Thought: I now can give a great answer\nFinal Answer: {body}"
+
+
+def fake_search(query: str) -> str:
+    return f"• **Offline result for: {query}**\nRecorded search results are not available offline."
+
+
+class _NoLimit:
+    def acquire(self, *args, **kwargs) -> bool:
+        return True
+
+
+# ------------------------------
+# Configuration
+# ------------------------------
+def load_config(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    config.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    recordings = {}
+    if config.get("recordings"):
+        recordings_path = os.path.join(os.path.dirname(os.path.abspath(path)), config["recordings"])
+        with open(recordings_path, encoding="utf-8") as f:
+            recordings = json.load(f)
+    config["_recordings"] = recordings
+    return config
+
+
+def _set_attr(obj, name: str, value, saved: list) -> None:
+    saved.append((obj, name, getattr(obj, name)))
+    setattr(obj, name, value)
+    # crewai keeps the un-interpolated description/goal around after the first kickoff
+    private = f"_original_{name}"
+    if hasattr(obj, private):
+        saved.append((obj, private, getattr(obj, private)))
+        setattr(obj, private, None)
+
+
+@contextlib.contextmanager
+def apply_config(config: dict, report_lab_values: list):
+    """
+    Temporarily apply a configuration's overrides and swap in the replay LLMs,
+    fake search and a no-op rate limiter. Everything is restored on exit.
+    """
+    saved = []
+    llms = {}
+    try:
+        for name in AGENT_NAMES:
+            agent = getattr(agents, name)
+            for attr, value in config.get("agents", {}).get(name, {}).items():
+                _set_attr(agent, attr, value, saved)
+            llm = ReplayLLM(
+                agent.role,
+                config["_recordings"].get(agent.role),
+                fake_answer(agent.role, report_lab_values),
+            )
+            _set_attr(agent, "llm", llm, saved)
+            llms[agent.role] = llm
+
+        for name in TASK_NAMES:
+            task = getattr(tasks_module, name)
+            for attr, value in config.get("tasks", {}).get(name, {}).items():
+                _set_attr(task, attr, value, saved)
+
+        _set_attr(tools.tools, "run_serper_search", fake_search, saved)
+        _set_attr(crew_runner, "groq_limiter", _NoLimit(), saved)
+        yield llms
+    finally:
+        for obj, attr, value in reversed(saved):
+            setattr(obj, attr, value)
+
+
+# ------------------------------
+# Running
+# ------------------------------
+def load_corpus(corpus_dir: str) -> list:
+    """
+    Extracted text and lab table for every PDF in the corpus (cached as artifacts).
+    """
+    corpus = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if not name.lower().endswith(".pdf"):
+            continue
+        path = os.path.join(corpus_dir, name)
+        with open(path, "rb") as f:
+            artifact_id = content_hash(f.read())
+        artifact = load_artifact(artifact_id)
+        if artifact is None:
+            pages, incomplete = extract_pdf_pages(path)
+            if incomplete:
+                # Don't store or compare a partial OCR; the next run tries the file again
+                logger.warning(f"Skipping {name}: OCR incomplete for page(s) {[n + 1 for n in incomplete]}")
+                continue
+            artifact = save_artifact(artifact_id, pages, file_name=name)
+        corpus.append({
+            "name": name,
+            "report_text": format_report_text(artifact["pages"]),
+            "lab_values": artifact.get("lab_values") or parse_lab_values(artifact["pages"]),
+        })
+    return corpus
+
+
+def run_config(config: dict, corpus: list, query: str) -> dict:
+    """
+    Returns {report name: {"results": {role: output}, "stats": {role: metrics}}}.
+    """
+    runs = {}
+    for report in corpus:
+        with apply_config(config, report["lab_values"]) as llms:
+            stats = {}
+            results = crew_runner.run_crew_pipeline(query, report_text=report["report_text"], stats=stats)
+            for role, llm in llms.items():
+                # The replay LLM's own counters replace crewai's (zero for custom LLMs)
+                stats.setdefault(role, {}).update({
+                    "llm_calls": llm.usage["calls"],
+                    "prompt_tokens": llm.usage["prompt_tokens"],
+                    "completion_tokens": llm.usage["completion_tokens"],
+                    "total_tokens": llm.usage["prompt_tokens"] + llm.usage["completion_tokens"],
+                })
+        runs[report["name"]] = {"results": results, "stats": stats}
+        logger.info(f"[{config['name']}] {report['name']} done")
+    return runs
+
+
+# ------------------------------
+# Comparison
+# ------------------------------
+def _verdict(text: str):
+    match = re.search(r"\b(yes|no)\b", text or "", re.I)
+    return match.group(1).lower() if match else None
+
+
+def _markers(text: str, lab_values: list) -> set:
+    lowered = (text or "").lower()
+    return {row["name"].lower() for row in lab_values if row["name"].lower() in lowered}
+
+
+def agreement(role: str, base: str, cand: str, lab_values: list) -> dict:
+    """
+    Structured agreement between two outputs: verifier verdict or the set of
+    lab markers discussed, plus plain text similarity.
+    """
+    similarity = difflib.SequenceMatcher(None, base or "", cand or "").ratio()
+    if role == agents.verifier.role:
+        structured = 1.0 if _verdict(base) == _verdict(cand) else 0.0
+    else:
+        a, b = _markers(base, lab_values), _markers(cand, lab_values)
+        structured = len(a & b) / len(a | b) if (a | b) else 1.0
+    return {"structured": round(structured, 3), "text_similarity": round(similarity, 3)}
+
+
+def _total(runs: dict, role: str, metric: str) -> float:
+    return sum(run["stats"].get(role, {}).get(metric, 0) for run in runs.values())
+
+
+def _change(base: float, cand: float):
+    if base == 0:
+        return 0.0 if cand == 0 else None
+    return round((cand - base) / base, 3)
+
+
+def recorded_roles(*configs) -> list:
+    """
+    Roles that replay recorded responses in every given configuration.
+    """
+    roles = [getattr(agents, name).role for name in AGENT_NAMES]
+    return [role for role in roles if all(config["_recordings"].get(role) for config in configs)]
+
+
+def compare(baseline: dict, candidate: dict, corpus: list, recorded: list = ()) -> dict:
+    lab_values = {report["name"]: report["lab_values"] for report in corpus}
+    roles = [getattr(agents, name).role for name in AGENT_NAMES]
+
+    per_agent = {}
+    for role in roles:
+        metrics = {}
+        for metric in ["latency_seconds", "llm_calls", "total_tokens", "tool_calls"]:
+            base, cand = _total(baseline, role, metric), _total(candidate, role, metric)
+            metrics[metric] = {"baseline": round(base, 3), "candidate": round(cand, 3), "change": _change(base, cand)}
+
+        scores = [
+            agreement(role, baseline[name]["results"].get(role), candidate[name]["results"].get(role), lab_values[name])
+            for name in baseline
+        ]
+        metrics["agreement"] = {
+            "structured": round(statistics.mean(s["structured"] for s in scores), 3) if scores else None,
+            "text_similarity": round(statistics.mean(s["text_similarity"] for s in scores), 3) if scores else None,
+        }
+        metrics["recorded"] = role in recorded
+        per_agent[role] = metrics
+
+    def totals(over: list) -> dict:
+        result = {}
+        for metric in ["latency_seconds", "llm_calls", "total_tokens", "tool_calls"]:
+            base = sum(per_agent[role][metric]["baseline"] for role in over)
+            cand = sum(per_agent[role][metric]["candidate"] for role in over)
+            result[metric] = {"baseline": round(base, 3), "candidate": round(cand, 3), "change": _change(base, cand)}
+        return result
+
+    return {
+        "reports": len(corpus),
+        "per_agent": per_agent,
+        "totals": totals(roles),
+        # Latency and tool calls are only meaningful for replayed recordings
+        "recorded_roles": list(recorded),
+        "recorded_totals": totals([role for role in roles if role in recorded]),
+    }
+
+
+def check_thresholds(report: dict, args) -> tuple:
+    """
+    Human-readable lists of threshold breaches (empty when the candidate passes)
+    and of warnings about checks that were skipped.
+    """
+    failures, warnings = [], []
+    limits = {
+        "total_tokens": args.max_token_increase,
+        "llm_calls": args.max_llm_call_increase,
+        "tool_calls": args.max_tool_call_increase,
+        "latency_seconds": args.max_latency_increase,
+    }
+    unrecorded = [role for role, metrics in report["per_agent"].items() if not metrics["recorded"]]
+    if unrecorded:
+        warnings.append(
+            f"No recordings for {', '.join(unrecorded)}: their latency and tool calls come from fake "
+            f"answers and are not checked"
+        )
+    for metric, limit in limits.items():
+        if metric in ("latency_seconds", "tool_calls"):
+            if not report["recorded_roles"]:
+                warnings.append(f"{metric} not checked: no role has recordings in both configurations")
+                continue
+            totals = report["recorded_totals"][metric]
+        else:
+            totals = report["totals"][metric]
+        change = totals["change"]
+        if metric == "latency_seconds" and totals["candidate"] - totals["baseline"] < args.min_latency_delta:
+            # Small absolute differences are timing noise, however large in relative terms
+            continue
+        if change is None or change > limit:
+            failures.append(f"{metric} went from {totals['baseline']} to {totals['candidate']} (limit +{limit:.0%})")
+    for role, metrics in report["per_agent"].items():
+        score = metrics["agreement"]["structured"]
+        if score is not None and score < args.min_agreement:
+            failures.append(f"{role}: structured agreement {score} below {args.min_agreement}")
+    return failures, warnings
+
+
+def format_markdown(report: dict, names: tuple) -> str:
+    lines = [
+        f"# Regression report: {names[0]} vs {names[1]} ({report['reports']} reports)",
+        "",
+        "| Agent | Latency (s) | LLM calls | Tokens | Tool calls | Agreement | Similarity |",
+        "|---|---|---|---|---|---|---|",
+    ]
+
+    def cell(m):
+        change = "n/a" if m["change"] is None else f"{m['change']:+.0%}"
+        return f"{m['baseline']} → {m['candidate']} ({change})"
+
+    for role, m in list(report["per_agent"].items()) + [("**Total**", None)]:
+        if m is None:
+            t = report["totals"]
+            lines.append(f"| {role} | {cell(t['latency_seconds'])} | {cell(t['llm_calls'])} | "
+                         f"{cell(t['total_tokens'])} | {cell(t['tool_calls'])} | | |")
+            continue
+        if not m["recorded"]:
+            role += " (fake)"
+        lines.append(
+            f"| {role} | {cell(m['latency_seconds'])} | {cell(m['llm_calls'])} | {cell(m['total_tokens'])} | "
+            f"{cell(m['tool_calls'])} | {m['agreement']['structured']} | {m['agreement']['text_similarity']} |"
+        )
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two pipeline configurations offline.")
+    parser.add_argument("--corpus", default=os.getenv("DATA_DIR", "data"), help="Directory of report PDFs.")
+    parser.add_argument("--baseline", required=True, help="Baseline configuration (JSON).")
+    parser.add_argument("--candidate", required=True, help="Candidate configuration (JSON).")
+    parser.add_argument("--query", default="Summarize my Blood Test Report")
+    parser.add_argument("--out", default="regression_report.json", help="Where to write the JSON report.")
+    parser.add_argument("--max-token-increase", type=float, default=0.10)
+    parser.add_argument("--max-llm-call-increase", type=float, default=0.10)
+    parser.add_argument("--max-tool-call-increase", type=float, default=0.0)
+    parser.add_argument("--max-latency-increase", type=float, default=0.25)
+    parser.add_argument("--min-latency-delta", type=float, default=0.5,
+                        help="Latency increases below this many seconds (in total) are never a failure.")
+    parser.add_argument("--min-agreement", type=float, default=0.5)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    baseline_config = load_config(args.baseline)
+    candidate_config = load_config(args.candidate)
+    corpus = load_corpus(args.corpus)
+    logger.info(f"Loaded {len(corpus)} report(s) from {args.corpus}")
+
+    baseline = run_config(baseline_config, corpus, args.query)
+    candidate = run_config(candidate_config, corpus, args.query)
+
+    report = compare(baseline, candidate, corpus, recorded_roles(baseline_config, candidate_config))
+    report["failures"], report["warnings"] = check_thresholds(report, args)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(format_markdown(report, (baseline_config["name"], candidate_config["name"])))
+    for warning in report["warnings"]:
+        print(f"⚠️ {warning}")
+    for failure in report["failures"]:
+        print(f"❌ {failure}")
+    if not report["failures"]:
+        print("✅ Candidate is within all thresholds.")
+    return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
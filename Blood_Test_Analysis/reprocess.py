@@ -0,0 +1,354 @@
+# reprocess.py
+#
+# Offline bulk re-analysis of the report archive, e.g. after a prompt change in
+# task.py or a model change in agents.py.
+#
+#   python reprocess.py --source mongo --workers 4
+#   python reprocess.py --source dir --data-dir ../data --workers 2
+#
+# Successful items are checkpointed, so re-running the same command after a
+# crash resumes where it stopped (and retries the items that failed). All
+# workers draw from the same Groq/Serper quota and LLM slots as the API (see
+# shared_state.py), as one "reprocess" tenant that leaves the interactive
+# reservation free.
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+from artifacts import artifact_exists, content_hash, load_artifact, save_artifact, save_results
+from celery_config import INTERACTIVE_RESERVED_SLOTS
+from database import MONGO_URI, DB_NAME
+from shared_state import llm_slots
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+)
+logging.getLogger("pymongo").setLevel(logging.WARNING)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("crewai").setLevel(logging.WARNING)
+logging.getLogger("liteLLM").setLevel(logging.WARNING)
+
+logger = logging.getLogger("reprocess")
+
+DEFAULT_QUERY = "Summarize my Blood Test Report"
+# Owner of the LLM slots taken by reprocessing (capped like any tenant)
+SLOT_OWNER = "reprocess"
+# Documents fetched per MongoDB query; each page is a short query, so no cursor stays idle
+MONGO_PAGE_SIZE = 200
+
+
+# ------------------------------
+# Checkpointing
+# ------------------------------
+class Checkpoint:
+    """
+    Append-only file of successfully reprocessed item keys; flushed after each bulk write.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        self.done.add(json.loads(line)["key"])
+            logger.info(f"Resuming: {len(self.done)} item(s) already done according to {path}")
+
+    def mark_done(self, keys: list) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            for key in keys:
+                f.write(json.dumps({"key": key, "at": time.time()}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(keys)
+
+
+# ------------------------------
+# Sources
+# ------------------------------
+def iter_mongo_items(collection, query_override: str = None):
+    """
+    Stream report documents; the text comes from the artifact store, not the PDF.
+    Pages through the collection by _id instead of holding one cursor open for
+    the whole (hours long) run, which the server would time out.
+    """
+    projection = {"query": 1, "artifact_id": 1, "report_text": 1}
+    last_id = None
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        docs = list(collection.find(query, projection).sort("_id", 1).limit(MONGO_PAGE_SIZE))
+        if not docs:
+            return
+        for doc in docs:
+            yield {
+                "key": str(doc["_id"]),
+                "query": query_override or doc.get("query") or DEFAULT_QUERY,
+                "artifact_id": doc.get("artifact_id"),
+                "report_text": doc.get("report_text"),
+            }
+        last_id = docs[-1]["_id"]
+
+
+def iter_dir_items(data_dir: str, query_override: str = None):
+    for name in sorted(os.listdir(data_dir)):
+        if not name.lower().endswith(".pdf"):
+            continue
+        yield {
+            "key": os.path.join(data_dir, name),
+            "query": query_override or DEFAULT_QUERY,
+            "file_path": os.path.join(data_dir, name),
+            "file_name": name,
+        }
+
+
+# ------------------------------
+# Worker
+# ------------------------------
+def failed_roles(results: dict) -> list:
+    """
+    Agents whose output is an error / skipped placeholder (they all start with ⚠️).
+    """
+    return [role for role, output in results.items()
+            if role == "error" or not isinstance(output, str) or output.startswith("⚠️")]
+
+
+def process_item(item: dict, dry_run: bool = False) -> dict:
+    """
+    Run extraction (only if no artifact exists yet) and the crew pipeline for one item.
+    Runs in a worker process; with `dry_run` nothing is stored.
+    """
+    # Imported in the worker so the parent never loads the agents / LLM clients
+    from crew_runner import run_crew_pipeline, clean_analysis
+    from tools.tools import extract_pdf_pages, format_report_text
+
+    started = time.time()
+    artifact_id = item.get("artifact_id")
+    report_text = item.get("report_text")
+
+    try:
+        if item.get("file_path"):
+            with open(item["file_path"], "rb") as f:
+                content = f.read()
+            artifact_id = content_hash(content)
+            artifact = load_artifact(artifact_id)
+            if artifact is None:
+                pages, incomplete = extract_pdf_pages(item["file_path"])
+                if incomplete:
+                    return {"key": item["key"], "status": "error",
+                            "reason": f"OCR incomplete for page(s) {[n + 1 for n in incomplete]}"}
+                if dry_run:
+                    artifact = {"pages": pages}
+                else:
+                    artifact = save_artifact(artifact_id, pages, file_name=item.get("file_name"), source=content)
+            report_text = format_report_text(artifact["pages"])
+        elif artifact_id:
+            artifact = load_artifact(artifact_id)
+            if artifact is not None:
+                report_text = format_report_text(artifact["pages"])
+
+        if not report_text or not report_text.strip():
+            return {"key": item["key"], "status": "skipped", "reason": "no stored report text"}
+
+        # Take an LLM slot like a batch job, keeping the interactive reservation free
+        holder = f"{SLOT_OWNER}:{os.getpid()}"
+        llm_slots.acquire(SLOT_OWNER, holder, reserve=INTERACTIVE_RESERVED_SLOTS)
+        try:
+            results = clean_analysis(run_crew_pipeline(item["query"], report_text=report_text))
+        finally:
+            llm_slots.release(holder)
+        failed = failed_roles(results)
+        if failed:
+            # Don't overwrite the stored analysis with error placeholders
+            return {"key": item["key"], "status": "error",
+                    "reason": f"no usable output from {', '.join(failed)}"}
+
+        return {
+            "key": item["key"],
+            "status": "ok",
+            "artifact_id": artifact_id,
+            "query": item["query"],
+            "file_name": item.get("file_name"),
+            "results": results,
+            "elapsed": time.time() - started,
+        }
+    except Exception as e:
+        logger.exception(f"Failed to reprocess {item['key']}")
+        return {"key": item["key"], "status": "error", "reason": str(e)}
+
+
+# ------------------------------
+# Bulk Writes
+# ------------------------------
+def build_write(result: dict, source: str):
+    analysis_str = json.dumps(result["results"], ensure_ascii=False, separators=(",", ":"))
+    now = datetime.utcnow()
+    if source == "mongo":
+        from bson import ObjectId
+        return UpdateOne(
+            {"_id": ObjectId(result["key"])},
+            {"$set": {"analysis": analysis_str, "reprocessed_at": now}}
+        )
+    # Reports from a directory are upserted by content hash, so re-runs don't duplicate them
+    return UpdateOne(
+        {"artifact_id": result["artifact_id"]},
+        {
+            "$set": {"analysis": analysis_str, "query": result["query"], "reprocessed_at": now},
+            "$setOnInsert": {
+                "user_name": "Unknown User",
+                "original_file_name": result["file_name"],
+                "follow_ups": [],
+                "created_at": now,
+            },
+        },
+        upsert=True
+    )
+
+
+def flush(collection, pending: list, checkpoint: Checkpoint, source: str, dry_run: bool) -> None:
+    """
+    Write the successful results and checkpoint them. Failed and skipped items
+    are not checkpointed, so the next run retries them. A dry run writes nothing.
+    """
+    ok = [r for r in pending if r["status"] == "ok"]
+    pending.clear()
+    if not ok or dry_run:
+        return
+    for result in ok:
+        if result["artifact_id"] and artifact_exists(result["artifact_id"]):
+            save_results(result["artifact_id"], result["results"])
+    collection.bulk_write([build_write(r, source) for r in ok], ordered=False)
+    checkpoint.mark_done([r["key"] for r in ok])
+
+
+# ------------------------------
+# Main Loop
+# ------------------------------
+def format_eta(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:d}h{(seconds % 3600) // 60:02d}m{seconds % 60:02d}s"
+
+
+def run(args) -> dict:
+    client = MongoClient(MONGO_URI)
+    collection = client[DB_NAME]["reports"]
+    checkpoint = Checkpoint(args.checkpoint)
+
+    if args.source == "mongo":
+        total = collection.count_documents({})
+        items = iter_mongo_items(collection, args.query)
+    else:
+        total = sum(1 for _ in iter_dir_items(args.data_dir))
+        items = iter_dir_items(args.data_dir, args.query)
+
+    items = (item for item in items if item["key"] not in checkpoint.done)
+    remaining = max(0, total - len(checkpoint.done))
+    if args.limit:
+        remaining = min(remaining, args.limit)
+    logger.info(f"Reprocessing {remaining} of {total} item(s) from {args.source} with {args.workers} worker(s)")
+
+    counts = {"ok": 0, "skipped": 0, "error": 0}
+    pending = []
+    started = last_report = time.time()
+    submitted = 0
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            in_flight = {}
+            exhausted = False
+            while True:
+                # Keep a bounded number of items in flight so the source is streamed
+                while not exhausted and len(in_flight) < args.workers * 2:
+                    if args.limit and submitted >= args.limit:
+                        exhausted = True
+                        break
+                    item = next(items, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    in_flight[executor.submit(process_item, item, args.dry_run)] = item
+                    submitted += 1
+
+                if not in_flight:
+                    break
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    item = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as e:
+                        # A worker died (e.g. out of memory); the pool can't take new work
+                        if not exhausted:
+                            logger.error("Worker pool broke; finishing in-flight items. Re-run to resume.")
+                        exhausted = True
+                        result = {"key": item["key"], "status": "error", "reason": f"worker crashed: {e}"}
+                    except Exception as e:
+                        result = {"key": item["key"], "status": "error", "reason": str(e)}
+                    counts[result["status"]] += 1
+                    if result["status"] != "ok":
+                        logger.warning(f"{result['key']}: {result['status']} ({result.get('reason')})")
+                    pending.append(result)
+
+                if len(pending) >= args.batch_size:
+                    flush(collection, pending, checkpoint, args.source, args.dry_run)
+
+                now = time.time()
+                if now - last_report >= args.report_every:
+                    done = sum(counts.values())
+                    rate = done / (now - started)
+                    eta = (remaining - done) / rate if rate else 0
+                    logger.info(
+                        f"{done}/{remaining} done ({counts['ok']} ok, {counts['skipped']} skipped, "
+                        f"{counts['error']} failed) | {rate * 60:.1f} reports/min | ETA {format_eta(eta)}"
+                    )
+                    last_report = now
+    finally:
+        # Don't throw away finished LLM work, whatever stopped the run
+        flush(collection, pending, checkpoint, args.source, args.dry_run)
+
+    elapsed = time.time() - started
+    logger.info(f"Finished in {format_eta(elapsed)}: {counts}")
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Re-run blood report analyses over the archive.")
+    parser.add_argument("--source", choices=["mongo", "dir"], default="mongo",
+                        help="Read reports from MongoDB (default) or a directory of PDFs.")
+    parser.add_argument("--data-dir", default=os.getenv("DATA_DIR", "data"),
+                        help="Directory of PDFs when --source dir.")
+    parser.add_argument("--query", default=None,
+                        help="Query to use for every report (default: each report's original query).")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("REPROCESS_WORKERS", 2)),
+                        help="Number of parallel worker processes.")
+    parser.add_argument("--batch-size", type=int, default=20,
+                        help="Results per bulk write / checkpoint flush.")
+    parser.add_argument("--checkpoint", default="reprocess.checkpoint.jsonl",
+                        help="Checkpoint file; delete it to start over.")
+    parser.add_argument("--limit", type=int, default=0,
+                        help="Stop after this many items (0 = no limit).")
+    parser.add_argument("--report-every", type=float, default=10.0,
+                        help="Seconds between progress reports.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Run the pipeline but don't write results, artifacts or the checkpoint.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -0,0 +1,329 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Path of the SQLite file shared by every API worker, Celery worker and CLI
+# process on the box. WAL mode lets readers and a writer work concurrently.
+STATE_DB_PATH = os.getenv(
+    "SHARED_STATE_DB",
+    os.path.join(tempfile.gettempdir(), "blood_test_shared_state.sqlite3")
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL
+);
+CREATE TABLE IF NOT EXISTS slot_leases (
+    pool TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (pool, holder)
+);
+CREATE TABLE IF NOT EXISTS queue_waits (
+    queue TEXT NOT NULL,
+    tenant TEXT NOT NULL,
+    wait_seconds REAL NOT NULL,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_queue_waits_recorded ON queue_waits (recorded_at);
+CREATE TABLE IF NOT EXISTS submissions (
+    tenant TEXT NOT NULL,
+    submitted_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_submissions_tenant ON submissions (tenant, submitted_at);
+"""
+
+# One connection per thread, re-opened after fork so that gunicorn/Celery
+# children never share a handle created by the parent process.
+_local = threading.local()
+
+
+def get_connection() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        conn = sqlite3.connect(STATE_DB_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def init_shared_state() -> None:
+    """
+    Create the state file and tables up front (called from the gunicorn master).
+    """
+    get_connection()
+    logger.info(f"Shared state initialised at {STATE_DB_PATH}")
+
+
+# ------------------------------
+# Rate Limiting
+# ------------------------------
+class RateLimiter:
+    """
+    Token bucket stored in the shared SQLite file, so every process on the
+    box draws from the same per-minute quota (Groq, Serper, ...).
+    """
+
+    def __init__(self, name: str, rate_per_minute: float, burst: float = None):
+        self.name = name
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1.0, rate_per_minute)
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """
+        Take `tokens` from the bucket if available.
+        Returns 0 on success, otherwise the number of seconds to wait.
+        """
+        conn = get_connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM rate_buckets WHERE name = ?",
+                (self.name,)
+            ).fetchone()
+            if row is None:
+                available = self.capacity
+            else:
+                elapsed = max(0.0, now - row[1])
+                available = min(self.capacity, row[0] + elapsed * self.rate_per_second)
+
+            if available >= tokens:
+                available -= tokens
+                wait = 0.0
+            else:
+                wait = (tokens - available) / self.rate_per_second
+
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                (self.name, available, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def acquire(self, tokens: float = 1.0, timeout: float = None) -> bool:
+        """
+        Block until `tokens` are available. Returns False if `timeout` expires first.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0:
+                return True
+            if deadline is not None and time.time() + wait > deadline:
+                return False
+            time.sleep(min(wait, 5.0))
+
+
+# ------------------------------
+# Caching
+# ------------------------------
+class SharedCache:
+    """
+    Small key/value cache (JSON-serialisable values) visible to all workers.
+    """
+
+    def __init__(self, namespace: str, ttl: float = None):
+        self.namespace = namespace
+        self.ttl = ttl
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key: str, default=None):
+        row = get_connection().execute(
+            "SELECT value, expires_at FROM cache WHERE key = ?",
+            (self._key(key),)
+        ).fetchone()
+        if row is None:
+            return default
+        if row[1] is not None and row[1] < time.time():
+            return default
+        return json.loads(row[0])
+
+    def set(self, key: str, value, ttl: float = None) -> None:
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.time() + ttl if ttl else None
+        get_connection().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (self._key(key), json.dumps(value, ensure_ascii=False), expires_at)
+        )
+
+    def purge_expired(self) -> int:
+        cur = get_connection().execute(
+            "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < ?",
+            (time.time(),)
+        )
+        return cur.rowcount
+
+
+# ------------------------------
+# Concurrency Slots
+# ------------------------------
+class SlotPool:
+    """
+    Bounded pool of concurrent slots (e.g. in-flight LLM pipelines) with a
+    per-owner cap, so one tenant can't hold every slot. Leases expire on
+    their own if a worker dies without releasing them.
+    """
+
+    def __init__(self, name: str, capacity: int, per_owner: int, lease_seconds: float = 900):
+        self.name = name
+        self.capacity = capacity
+        self.per_owner = per_owner
+        self.lease_seconds = lease_seconds
+
+    def try_acquire(self, owner: str, holder: str, reserve: int = 0) -> bool:
+        """
+        Take a slot for `holder` on behalf of `owner`. `reserve` slots are kept
+        free for other callers (e.g. batch work leaves room for interactive jobs).
+        """
+        conn = get_connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "DELETE FROM slot_leases WHERE pool = ? AND expires_at < ?",
+                (self.name, now)
+            )
+            total, owned = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(owner = ?), 0) FROM slot_leases WHERE pool = ?",
+                (owner, self.name)
+            ).fetchone()
+            acquired = total < self.capacity - reserve and owned < self.per_owner
+            if acquired:
+                conn.execute(
+                    "INSERT OR REPLACE INTO slot_leases (pool, owner, holder, expires_at) VALUES (?, ?, ?, ?)",
+                    (self.name, owner, holder, now + self.lease_seconds)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return acquired
+
+    def acquire(self, owner: str, holder: str, reserve: int = 0,
+                timeout: float = None, poll_seconds: float = 0.5) -> bool:
+        """
+        Block until a slot is free. Returns False if `timeout` expires first.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while not self.try_acquire(owner, holder, reserve=reserve):
+            if deadline is not None and time.time() + poll_seconds > deadline:
+                return False
+            time.sleep(poll_seconds)
+        return True
+
+    def release(self, holder: str) -> None:
+        get_connection().execute(
+            "DELETE FROM slot_leases WHERE pool = ? AND holder = ?",
+            (self.name, holder)
+        )
+
+    def usage(self) -> dict:
+        """
+        Active slots per owner.
+        """
+        rows = get_connection().execute(
+            "SELECT owner, COUNT(*) FROM slot_leases WHERE pool = ? AND expires_at >= ? GROUP BY owner",
+            (self.name, time.time())
+        ).fetchall()
+        return {owner: count for owner, count in rows}
+
+
+# ------------------------------
+# Queue Metrics
+# ------------------------------
+def record_queue_wait(queue: str, tenant: str, wait_seconds: float) -> None:
+    conn = get_connection()
+    now = time.time()
+    conn.execute(
+        "INSERT INTO queue_waits (queue, tenant, wait_seconds, recorded_at) VALUES (?, ?, ?, ?)",
+        (queue, tenant, wait_seconds, now)
+    )
+    # Keep only the last day of samples
+    conn.execute("DELETE FROM queue_waits WHERE recorded_at < ?", (now - 86400,))
+
+
+def record_submission(tenant: str, window_seconds: float) -> int:
+    """
+    Record a submission for `tenant` and return how many it made in the last
+    `window_seconds` (including this one).
+    """
+    conn = get_connection()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM submissions WHERE submitted_at < ?", (now - window_seconds,))
+        conn.execute("INSERT INTO submissions (tenant, submitted_at) VALUES (?, ?)", (tenant, now))
+        count = conn.execute(
+            "SELECT COUNT(*) FROM submissions WHERE tenant = ? AND submitted_at >= ?",
+            (tenant, now - window_seconds)
+        ).fetchone()[0]
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return count
+
+
+def queue_wait_stats(window_seconds: float = 900) -> dict:
+    """
+    Count, mean, p95 and max wait time per queue over the last `window_seconds`.
+    """
+    rows = get_connection().execute(
+        "SELECT queue, wait_seconds FROM queue_waits WHERE recorded_at >= ? ORDER BY queue, wait_seconds",
+        (time.time() - window_seconds,)
+    ).fetchall()
+
+    waits = {}
+    for queue, wait in rows:
+        waits.setdefault(queue, []).append(wait)
+
+    stats = {}
+    for queue, values in waits.items():
+        stats[queue] = {
+            "count": len(values),
+            "mean_seconds": round(sum(values) / len(values), 3),
+            "p95_seconds": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+            "max_seconds": round(values[-1], 3),
+        }
+    return stats
+
+
+# ------------------------------
+# Shared Quotas
+# ------------------------------
+# Defaults match the free-tier limits; override per deployment in .env
+groq_limiter = RateLimiter("groq", float(os.getenv("GROQ_RPM", 30)))
+serper_limiter = RateLimiter("serper", float(os.getenv("SERPER_RPM", 60)))
+
+# Concurrent crew pipelines allowed on this box, and the share any one tenant may hold
+llm_slots = SlotPool(
+    "llm",
+    capacity=int(os.getenv("LLM_MAX_SLOTS", 4)),
+    per_owner=int(os.getenv("TENANT_MAX_SLOTS", 2))
+)
+
+# Search results rarely change, so cache them for a day across all workers
+search_cache = SharedCache("serper", ttl=float(os.getenv("SEARCH_CACHE_TTL", 86400)))
@@ -1,10 +1,23 @@
 from crewai import Task
-from agents import doctor, verifier, nutritionist, exercise_specialist, analyze_blood_report
+from agents import doctor, verifier, nutritionist, exercise_specialist
 from tools.tools import ResearchSearchTool,BloodTestReportTool,NutritionSearchTool,ExerciseSearchTool
 from typing import List, Optional
-from celery_config import celery_app  # Import celery app instance
-from time import sleep
+from celery_config import (  # Import celery app instance
+    celery_app,
+    INTERACTIVE_QUEUE,
+    BATCH_QUEUE,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_NORMAL,
+    PRIORITY_BULK,
+    TENANT_RETRY_SECONDS,
+    INTERACTIVE_RESERVED_SLOTS,
+    INTERACTIVE_MAX_PER_WINDOW,
+    INTERACTIVE_WINDOW_SECONDS,
+)
+from shared_state import llm_slots, record_queue_wait, record_submission
 import logging
+import os
+import time
 
 # Initialize logger for debugging and error handling
 logging.basicConfig(level=logging.INFO)
@@ -119,14 +132,106 @@ exercise_planning = create_task(
 )
 
 
+# Task 5: Follow-up question on an already analysed report
+# One task per specialist; the crew runner picks the one matching the question.
+def create_follow_up_task(agent) -> Task:
+    return create_task(
+        description="""
+        **Inputs**  
+        - `report_text`: the full blood test report as plain text.  
+        - `prior_analysis`: the earlier analysis of this report by the care team.  
+        - `query`: the patient's follow-up question.  
+
+        **Report**  
+        {report_text}
+
+        **Earlier Analysis**  
+        {prior_analysis}
+
+        **Follow-up Question**  
+        {query}
+
+        **Objectives**  
+        1. Answer the follow-up question directly, building on the earlier analysis instead of repeating it.  
+        2. Refer to the specific lab values from the report that support your answer.  
+        3. Avoid listing external links or suggesting the user visit other websites.
+
+        **Output**  
+        A short, plain-language answer to the follow-up question.
+        """,
+        expected_output="A concise answer to the follow-up question, consistent with the earlier analysis.",
+        agent=agent,
+        tools=[],
+    )
+
+
+follow_up_doctor = create_follow_up_task(doctor)
+follow_up_nutrition = create_follow_up_task(nutritionist)
+follow_up_exercise = create_follow_up_task(exercise_specialist)
+
+
 # Celery Task to process blood report asynchronously
-@celery_app.task
-def process_blood_report(file_path: str, query: str):
+# Jobs are scheduled fairly: each tenant may hold at most TENANT_MAX_SLOTS of the
+# shared LLM slots; when its share is used up the job goes back on its queue.
+@celery_app.task(bind=True, max_retries=None, acks_late=True)
+def process_blood_report(self, file_path: str, query: str, tenant_id: str = "default",
+                         interactive: bool = False, enqueued_at: float = None,
+                         priority: int = PRIORITY_NORMAL):
+    queue = INTERACTIVE_QUEUE if interactive else BATCH_QUEUE
+    reserve = 0 if interactive else INTERACTIVE_RESERVED_SLOTS
+    holder = self.request.id or f"{tenant_id}-{time.time()}"
+
+    if not llm_slots.try_acquire(tenant_id, holder, reserve=reserve):
+        # Re-queue with the lane and priority the job was submitted with
+        raise self.retry(countdown=TENANT_RETRY_SECONDS, queue=queue, priority=priority)
+
+    if enqueued_at is not None:
+        record_queue_wait(queue, tenant_id, time.time() - enqueued_at)
+
     try:
-        logger.info(f"Started async processing for {file_path} with query '{query}'")
-        sleep(5)
-        result = analyze_blood_report(file_path, query)
+        logger.info(f"Started async processing for {file_path} with query '{query}' (tenant: {tenant_id})")
+        # Imported here: crew_runner imports this module for the task definitions
+        from crew_runner import run_crew_pipeline
+        result = run_crew_pipeline(query, file_path)
         return {"status": "success", "result": result}
     except Exception as e:
         logger.error(f"Error in async blood report task: {e}")
         return {"status": "failure", "error": str(e)}
+    finally:
+        llm_slots.release(holder)
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+
+def choose_lane(tenant_id: str, bulk: bool = False) -> tuple:
+    """
+    Decide the (queue, priority) for a new report on the server side.
+    A report goes to the interactive lane unless the tenant marked it as bulk
+    or has already sent more than INTERACTIVE_MAX_PER_WINDOW reports recently.
+    """
+    recent = record_submission(tenant_id, INTERACTIVE_WINDOW_SECONDS)
+    if bulk or recent > INTERACTIVE_MAX_PER_WINDOW:
+        return BATCH_QUEUE, PRIORITY_BULK
+    return INTERACTIVE_QUEUE, PRIORITY_INTERACTIVE
+
+
+def submit_analysis(file_path: str, query: str, tenant_id: str = "default", bulk: bool = False):
+    """
+    Enqueue a report for analysis in the lane chosen by choose_lane.
+    """
+    queue, priority = choose_lane(tenant_id, bulk)
+
+    return process_blood_report.apply_async(
+        kwargs={
+            "file_path": file_path,
+            "query": query,
+            "tenant_id": tenant_id,
+            "interactive": queue == INTERACTIVE_QUEUE,
+            "enqueued_at": time.time(),
+            "priority": priority,
+        },
+        queue=queue,
+        priority=priority,
+    )
@@ -0,0 +1,23 @@
+import os
+import sys
+import threading
+
+import pytest
+
+# The app modules import each other as top-level modules (e.g. `from budget import ...`)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# agents.py builds the Groq client at import time; tests never call it
+os.environ.setdefault("GROQ_API_KEY", "test")
+
+
+@pytest.fixture
+def state_db(tmp_path, monkeypatch):
+    """
+    Point shared_state at a fresh SQLite file for one test.
+    """
+    import shared_state
+
+    monkeypatch.setattr(shared_state, "STATE_DB_PATH", str(tmp_path / "state.sqlite3"))
+    monkeypatch.setattr(shared_state, "_local", threading.local())
+    return shared_state
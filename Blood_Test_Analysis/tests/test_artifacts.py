@@ -0,0 +1,74 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("msgpack")
+pytest.importorskip("zstandard")
+
+import artifacts
+
+PAGES = ["Hemoglobin 11.2 g/dL 13.0 - 17.0\nPatient ID 123456", "Glucose 90 mg/dL 70 - 100"]
+
+
+@pytest.fixture(autouse=True)
+def artifact_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifacts, "ARTIFACT_DIR", str(tmp_path / "artifacts"))
+    return tmp_path / "artifacts"
+
+
+def test_round_trip():
+    artifact_id = artifacts.content_hash(b"%PDF report")
+    assert artifacts.load_artifact(artifact_id) is None
+
+    saved = artifacts.save_artifact(artifact_id, PAGES, file_name="report.pdf")
+    loaded = artifacts.load_artifact(artifact_id)
+    assert loaded == saved
+    assert loaded["pages"] == PAGES
+    assert loaded["file_name"] == "report.pdf"
+    assert [(row["name"], row["flag"]) for row in loaded["lab_values"]] == [("Hemoglobin", "L"), ("Glucose", "N")]
+    assert list(artifacts.iter_artifacts()) == [artifact_id]
+
+
+def test_same_content_is_stored_once():
+    artifact_id = artifacts.content_hash(b"%PDF report")
+    artifacts.save_artifact(artifact_id, PAGES)
+    path = artifacts._artifact_path(artifact_id)
+    mtime = os.stat(path).st_mtime_ns
+
+    again = artifacts.save_artifact(artifact_id, ["different extraction"], file_name="copy.pdf")
+    assert again["pages"] == PAGES
+    assert os.stat(path).st_mtime_ns == mtime
+    assert list(artifacts.iter_artifacts()) == [artifact_id]
+
+
+def test_save_results():
+    artifact_id = artifacts.content_hash(b"%PDF report")
+    artifacts.save_artifact(artifact_id, PAGES)
+    artifacts.save_results(artifact_id, {"Doctor": "Hemoglobin is low."})
+
+    loaded = artifacts.load_artifact(artifact_id)
+    assert loaded["results"] == {"Doctor": "Hemoglobin is low."}
+    assert loaded["pages"] == PAGES
+    assert "updated_at" in loaded
+
+
+def test_save_results_needs_an_artifact():
+    with pytest.raises(KeyError):
+        artifacts.save_results(artifacts.content_hash(b"missing"), {})
+
+
+def test_concurrent_writers_from_threads():
+    artifact_ids = [artifacts.content_hash(f"report {i}".encode()) for i in range(4)]
+    for artifact_id in artifact_ids:
+        artifacts.save_artifact(artifact_id, PAGES)
+
+    def write(n):
+        artifact_id = artifact_ids[n % len(artifact_ids)]
+        artifacts.save_results(artifact_id, {"run": n})
+        return artifacts.load_artifact(artifact_id)["pages"]
+
+    with ThreadPoolExecutor(8) as executor:
+        assert all(pages == PAGES for pages in executor.map(write, range(40)))
+    for artifact_id in artifact_ids:
+        assert "run" in artifacts.load_artifact(artifact_id)["results"]
@@ -0,0 +1,84 @@
+import pytest
+
+from budget import ExecutionBudget, estimate_tokens
+
+
+def test_unlimited_budget_is_never_exhausted():
+    budget = ExecutionBudget(max_llm_calls=None, max_tool_calls=None, max_tokens=None, deadline_seconds=None)
+    budget.charge_llm("Doctor", 100, 1_000_000)
+    assert budget.exhausted() is None
+    assert budget.remaining_llm_calls() is None
+    assert budget.remaining_seconds() is None
+    assert budget.try_charge_tool()
+
+
+def test_llm_calls_exhausted_records_the_agent():
+    budget = ExecutionBudget(max_llm_calls=3, max_tokens=None, deadline_seconds=None)
+    budget.charge_llm("Verifier", 2)
+    assert budget.remaining_llm_calls() == 1
+    assert budget.exhausted() is None
+
+    budget.charge_llm("Doctor", 1)
+    assert budget.remaining_llm_calls() == 0
+    assert budget.exhausted() == "llm_calls"
+    assert budget.report()["exhausted_by"] == "Doctor"
+
+
+def test_tokens_exhausted():
+    budget = ExecutionBudget(max_llm_calls=None, max_tokens=1000, deadline_seconds=None)
+    budget.charge_llm("Doctor", 1, 600)
+    assert budget.exhausted() is None
+    budget.charge_llm("Nutritionist", 1, 400)
+    assert budget.exhausted() == "tokens"
+    assert budget.report()["exhausted_by"] == "Nutritionist"
+
+
+def test_first_limit_hit_is_kept():
+    budget = ExecutionBudget(max_llm_calls=1, max_tokens=10, deadline_seconds=None)
+    budget.charge_llm("Doctor", 1)
+    budget.charge_llm("Nutritionist", 0, 50)
+    assert budget.exhausted() == "llm_calls"
+    assert budget.report()["exhausted_by"] == "Doctor"
+
+
+def test_deadline(monkeypatch):
+    budget = ExecutionBudget(max_llm_calls=None, max_tokens=None, deadline_seconds=10)
+    budget.current_agent = "Doctor"
+    assert budget.exhausted() is None
+    assert 0 < budget.remaining_seconds() <= 10
+
+    monkeypatch.setattr(budget, "started", budget.started - 11)
+    assert budget.remaining_seconds() == 0
+    assert budget.exhausted() == "deadline"
+    assert budget.report()["exhausted_by"] == "Doctor"
+
+
+def test_tool_calls_do_not_stop_the_pipeline():
+    budget = ExecutionBudget(max_tool_calls=1, max_llm_calls=None, max_tokens=None, deadline_seconds=None)
+    budget.current_agent = "Nutritionist"
+    assert budget.try_charge_tool()
+    assert not budget.try_charge_tool()
+    assert budget.exhausted() is None
+
+    report = budget.report()
+    assert report["used"]["tool_calls"] == 1
+    assert report["tool_calls_exhausted_by"] == "Nutritionist"
+    assert report["by_agent"]["Nutritionist"]["tool_calls"] == 1
+
+
+def test_report_totals_by_agent():
+    budget = ExecutionBudget(deadline_seconds=None)
+    budget.charge_llm("Verifier", 1, 100)
+    budget.charge_llm("Doctor", 2, 300)
+    budget.skipped.append("Exercise Specialist")
+
+    report = budget.report()
+    assert report["used"]["llm_calls"] == 3
+    assert report["used"]["tokens"] == 400
+    assert report["by_agent"]["Doctor"] == {"llm_calls": 2, "tool_calls": 0, "tokens": 300}
+    assert report["skipped_agents"] == ["Exercise Specialist"]
+
+
+@pytest.mark.parametrize("text, tokens", [("", 1), (None, 1), ("abcd" * 10, 10)])
+def test_estimate_tokens(text, tokens):
+    assert estimate_tokens(text) == tokens
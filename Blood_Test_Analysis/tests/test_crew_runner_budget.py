@@ -0,0 +1,66 @@
+import pytest
+
+pytest.importorskip("crewai")
+
+import crew_runner
+from agents import doctor
+from budget import BudgetExceeded, ExecutionBudget
+from task import help_patients
+
+
+def _expired_budget(monkeypatch):
+    budget = ExecutionBudget(deadline_seconds=1)
+    monkeypatch.setattr(budget, "started", budget.started - 2)
+    return budget
+
+
+class _CountingLimiter:
+    def __init__(self):
+        self.calls = 0
+
+    def acquire(self, tokens=1.0, timeout=None):
+        self.calls += 1
+        return True
+
+
+def test_no_llm_call_after_the_deadline(monkeypatch):
+    limiter = _CountingLimiter()
+    monkeypatch.setattr(crew_runner, "groq_limiter", limiter)
+    budget = _expired_budget(monkeypatch)
+
+    with pytest.raises(BudgetExceeded):
+        crew_runner._acquire_llm_call(budget)
+    assert limiter.calls == 0
+    assert budget.exhausted() == "deadline"
+
+
+def test_run_step_refuses_an_exhausted_budget(monkeypatch):
+    limiter = _CountingLimiter()
+    monkeypatch.setattr(crew_runner, "groq_limiter", limiter)
+
+    with pytest.raises(BudgetExceeded, match="deadline"):
+        crew_runner._run_step(help_patients, doctor, {"query": "q", "report_text": "t"},
+                              budget=_expired_budget(monkeypatch))
+    assert limiter.calls == 0
+
+
+def test_pipeline_skips_every_agent_after_the_deadline(monkeypatch):
+    budget = _expired_budget(monkeypatch)
+    results = crew_runner.run_crew_pipeline("q", report_text="Hemoglobin 13.5 g/dL", budget=budget)
+    assert all(output.startswith("⚠️ Skipped") for output in results.values())
+    assert len(budget.skipped) == 4
+
+
+def test_agent_limits_clamps_and_restores():
+    agent = doctor.copy()
+    saved = (agent.max_iter, agent.max_retry_limit, agent.step_callback, agent.tools)
+    budget = ExecutionBudget(max_llm_calls=2, max_tool_calls=0)
+
+    with crew_runner._agent_limits(agent, budget):
+        assert agent.max_iter == 1
+        assert agent.max_retry_limit == 0
+        assert agent.tools == []
+        assert budget.current_agent == agent.role
+
+    assert (agent.max_iter, agent.max_retry_limit, agent.step_callback, agent.tools) == saved
+    assert budget.current_agent is None
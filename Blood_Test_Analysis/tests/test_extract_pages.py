@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip("pdfplumber")
+pytest.importorskip("crewai")
+
+import tools.tools
+
+
+def _blank_pdf(path, pages: int) -> None:
+    """
+    Write a minimal PDF of empty pages (no text layer, like a blank scan).
+    """
+    kids = " ".join(f"{3 + i} 0 R" for i in range(pages))
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>",
+    ] + ["<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >>"] * pages
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(out)
+
+
+def test_blank_ocr_page_is_complete_and_failed_page_is_not(tmp_path, monkeypatch):
+    pdf = tmp_path / "scan.pdf"
+    _blank_pdf(pdf, 3)
+    # Page 1 is text, page 2 a blank back side, page 3 failed (timeout / no Tesseract)
+    monkeypatch.setattr(tools.tools, "ocr_pages", lambda path, numbers: ["Hemoglobin 13.5 g/dL", "", None])
+
+    pages, incomplete = tools.tools.extract_pdf_pages(str(pdf))
+    assert pages[:2] == ["Hemoglobin 13.5 g/dL", ""]
+    assert not pages[2].strip()
+    assert incomplete == [2]
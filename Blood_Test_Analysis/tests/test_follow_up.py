@@ -0,0 +1,47 @@
+import pytest
+
+pytest.importorskip("crewai")
+
+import crew_runner
+from agents import doctor, exercise_specialist, nutritionist
+from task import follow_up_doctor, follow_up_exercise, follow_up_nutrition
+
+
+@pytest.mark.parametrize("query, task, agent", [
+    ("What should I eat to raise my iron?", follow_up_nutrition, nutritionist),
+    ("Is a vitamin D supplement a good idea?", follow_up_nutrition, nutritionist),
+    ("Can I keep running with low hemoglobin?", follow_up_exercise, exercise_specialist),
+    ("Which workout is safe for me?", follow_up_exercise, exercise_specialist),
+    ("What does a high ALT mean?", follow_up_doctor, doctor),
+])
+def test_select_follow_up_routes_by_keyword(query, task, agent):
+    assert crew_runner.select_follow_up(query) == (task, agent)
+
+
+def test_select_follow_up_matches_word_starts_only():
+    # "prune" contains "run" but is not about running
+    assert crew_runner.select_follow_up("Should I prune my questions?") == (follow_up_doctor, doctor)
+
+
+def test_format_prior_analysis_sections_and_recent_follow_ups():
+    prior = {"Doctor": "Hemoglobin is low.", "Nutritionist": "Eat more iron."}
+    follow_ups = [{"query": f"q{i}", "answer": f"a{i}"} for i in range(5)]
+
+    text = crew_runner.format_prior_analysis(prior, follow_ups)
+    assert text.startswith("### Doctor\nHemoglobin is low.\n\n### Nutritionist\nEat more iron.")
+    # Only the last three follow-ups are kept
+    assert "q1" not in text
+    assert "### Earlier question: q2\na2" in text
+    assert text.endswith("### Earlier question: q4\na4")
+
+
+def test_format_prior_analysis_truncates(monkeypatch):
+    monkeypatch.setattr(crew_runner, "MAX_PRIOR_CHARS", 50)
+    text = crew_runner.format_prior_analysis({"Doctor": "x" * 200})
+    assert text == ("### Doctor\n" + "x" * 200)[:50] + "\n\n[...TRUNCATED...]"
+
+
+def test_follow_up_budget_allows_one_call_and_no_tools():
+    budget = crew_runner.follow_up_budget()
+    assert budget.max_llm_calls == 1
+    assert not budget.try_charge_tool()
@@ -0,0 +1,56 @@
+import pytest
+
+from lab_values import parse_lab_line, parse_lab_values
+
+
+def test_row_with_unit_and_range():
+    row = parse_lab_line("Hemoglobin 11.2 g/dL 13.0 - 17.0")
+    assert row == {
+        "name": "Hemoglobin",
+        "value": 11.2,
+        "unit": "g/dL",
+        "ref_low": 13.0,
+        "ref_high": 17.0,
+        "flag": "L",
+    }
+
+
+def test_row_with_range_only():
+    row = parse_lab_line("Platelet Count : 450 150 - 400")
+    assert row["value"] == 450
+    assert row["unit"] is None
+    assert row["flag"] == "H"
+
+
+def test_row_with_known_unit_only():
+    row = parse_lab_line("WBC 7.1 10^3/uL")
+    assert row["unit"] == "10^3/uL"
+    assert row["ref_low"] is None
+    assert row["flag"] is None
+
+
+def test_known_units_are_matched_case_and_micro_insensitively():
+    assert parse_lab_line("Vitamin B12 350 PG/ML") is not None
+    assert parse_lab_line("Creatinine 80 µmol/L") is not None
+
+
+@pytest.mark.parametrize("line", [
+    "Sample Collected on 12/05/2023",
+    "Patient ID 123456",
+    "Lab No. 12345 Ref",
+    "Age 45 Years",
+    "Page 1 of 3",
+    "Reported at 10:30 AM",
+    "Total 3 tests",
+])
+def test_non_result_lines_are_skipped(line):
+    assert parse_lab_line(line) is None
+
+
+def test_parse_lab_values_over_pages():
+    pages = [
+        "Patient ID 123456\nHemoglobin 13.5 g/dL 13.0 - 17.0\n",
+        "Sample Collected on 12/05/2023\nGlucose 110 mg/dL 70 - 100",
+    ]
+    rows = parse_lab_values(pages)
+    assert [(r["name"], r["flag"]) for r in rows] == [("Hemoglobin", "N"), ("Glucose", "H")]
@@ -0,0 +1,36 @@
+import time
+
+
+def test_rate_limiter_burst_then_wait(state_db):
+    limiter = state_db.RateLimiter("test", rate_per_minute=60, burst=2)
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() == 0
+    wait = limiter.try_acquire()
+    assert 0 < wait <= 1.0
+
+
+def test_rate_limiter_refills(state_db, monkeypatch):
+    limiter = state_db.RateLimiter("test", rate_per_minute=60, burst=1)
+    now = time.time()
+    monkeypatch.setattr(state_db.time, "time", lambda: now)
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() > 0
+
+    monkeypatch.setattr(state_db.time, "time", lambda: now + 1.0)
+    assert limiter.try_acquire() == 0
+
+
+def test_rate_limiter_acquire_times_out(state_db):
+    limiter = state_db.RateLimiter("test", rate_per_minute=1, burst=1)
+    assert limiter.acquire(timeout=0)
+    started = time.monotonic()
+    assert not limiter.acquire(timeout=0.1)
+    assert time.monotonic() - started < 1.0
+
+
+def test_rate_limiters_are_independent(state_db):
+    groq = state_db.RateLimiter("groq-test", rate_per_minute=1, burst=1)
+    serper = state_db.RateLimiter("serper-test", rate_per_minute=1, burst=1)
+    assert groq.try_acquire() == 0
+    assert serper.try_acquire() == 0
+    assert groq.try_acquire() > 0
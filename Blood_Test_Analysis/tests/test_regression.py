@@ -0,0 +1,79 @@
+import pytest
+
+pytest.importorskip("crewai")
+
+import agents
+import regression
+
+ROLES = [getattr(agents, name).role for name in regression.AGENT_NAMES]
+LAB_VALUES = [
+    {"name": "Hemoglobin", "value": 11.2, "unit": "g/dL", "ref_low": 13.0, "ref_high": 17.0, "flag": "L"},
+    {"name": "Glucose", "value": 90.0, "unit": "mg/dL", "ref_low": 70.0, "ref_high": 100.0, "flag": "N"},
+]
+CORPUS = [{"name": "report.pdf", "report_text": "", "lab_values": LAB_VALUES}]
+
+
+def _runs(latency=1.0, tokens=100, tool_calls=0, doctor="Hemoglobin is low."):
+    stats = {role: {"latency_seconds": latency, "llm_calls": 1, "total_tokens": tokens, "tool_calls": tool_calls}
+             for role in ROLES}
+    results = {role: "Hemoglobin is low." for role in ROLES}
+    results[agents.verifier.role] = "Yes, this is a blood test report."
+    results[agents.doctor.role] = doctor
+    return {"report.pdf": {"results": results, "stats": stats}}
+
+
+def _args(*extra):
+    return regression.parse_args(["--baseline", "base.json", "--candidate", "cand.json", *extra])
+
+
+def test_compare_totals_and_agreement():
+    report = regression.compare(_runs(), _runs(tokens=120, doctor="Glucose is fine."), CORPUS, recorded=ROLES)
+    assert report["reports"] == 1
+    assert report["totals"]["total_tokens"] == {"baseline": 400, "candidate": 480, "change": 0.2}
+    doctor = report["per_agent"][agents.doctor.role]
+    assert doctor["recorded"]
+    # Baseline discusses Hemoglobin, candidate only Glucose
+    assert doctor["agreement"]["structured"] == 0.0
+    assert report["per_agent"][agents.verifier.role]["agreement"]["structured"] == 1.0
+
+
+def test_identical_runs_pass():
+    report = regression.compare(_runs(), _runs(), CORPUS, recorded=ROLES)
+    assert regression.check_thresholds(report, _args()) == ([], [])
+
+
+def test_token_increase_fails():
+    report = regression.compare(_runs(), _runs(tokens=120), CORPUS, recorded=ROLES)
+    failures, _ = regression.check_thresholds(report, _args())
+    assert any(failure.startswith("total_tokens") for failure in failures)
+
+
+def test_latency_and_tool_calls_only_gated_on_recorded_roles():
+    slower = _runs(latency=5.0, tool_calls=1)
+    report = regression.compare(_runs(), slower, CORPUS, recorded=[])
+    failures, warnings = regression.check_thresholds(report, _args())
+    assert failures == []
+    assert any("No recordings for" in warning for warning in warnings)
+    assert any(warning.startswith("latency_seconds not checked") for warning in warnings)
+
+    report = regression.compare(_runs(), slower, CORPUS, recorded=ROLES[:1])
+    assert report["recorded_totals"]["latency_seconds"] == {"baseline": 1.0, "candidate": 5.0, "change": 4.0}
+    failures, _ = regression.check_thresholds(report, _args())
+    assert any(failure.startswith("latency_seconds") for failure in failures)
+    assert any(failure.startswith("tool_calls") for failure in failures)
+
+
+def test_latency_floor():
+    # +40% but only 0.4s in total across the recorded role: timing noise
+    report = regression.compare(_runs(latency=1.0), _runs(latency=1.4), CORPUS, recorded=ROLES[:1])
+    assert regression.check_thresholds(report, _args())[0] == []
+
+    failures, _ = regression.check_thresholds(report, _args("--min-latency-delta", "0.1"))
+    assert any(failure.startswith("latency_seconds") for failure in failures)
+
+
+def test_recorded_roles_needs_recordings_in_both_configs():
+    doctor = agents.doctor.role
+    base = {"_recordings": {doctor: ["Final Answer: ok"], agents.verifier.role: ["Final Answer: Yes"]}}
+    cand = {"_recordings": {doctor: ["Final Answer: ok"]}}
+    assert regression.recorded_roles(base, cand) == [doctor]
@@ -0,0 +1,70 @@
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("celery")
+pytest.importorskip("motor")
+
+import reprocess
+
+
+def test_checkpoint_resumes(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    checkpoint = reprocess.Checkpoint(path)
+    assert checkpoint.done == set()
+
+    checkpoint.mark_done(["a", "b"])
+    checkpoint.mark_done(["c"])
+    assert reprocess.Checkpoint(path).done == {"a", "b", "c"}
+
+
+def test_failed_roles():
+    results = {
+        "Verifier": "Yes, this is a blood test report.",
+        "Doctor": "⚠️ Error in Doctor: rate limited",
+        "Nutritionist": "⚠️ Skipped Nutritionist: execution budget exhausted (deadline).",
+        "Coach": None,
+    }
+    assert reprocess.failed_roles(results) == ["Doctor", "Nutritionist", "Coach"]
+    assert reprocess.failed_roles({"error": "Error extracting PDF: broken"}) == ["error"]
+    assert reprocess.failed_roles({"Doctor": "All values are normal."}) == []
+
+
+class _Collection:
+    def __init__(self):
+        self.writes = []
+
+    def bulk_write(self, writes, ordered=True):
+        self.writes.extend(writes)
+
+
+def _results():
+    return [
+        {"key": "64b000000000000000000001", "status": "ok", "artifact_id": None,
+         "query": "q", "file_name": None, "results": {"Doctor": "fine"}},
+        {"key": "64b000000000000000000002", "status": "error", "reason": "no usable output from Doctor"},
+        {"key": "64b000000000000000000003", "status": "skipped", "reason": "no stored report text"},
+    ]
+
+
+def test_flush_writes_and_checkpoints_only_ok_items(tmp_path):
+    collection = _Collection()
+    checkpoint = reprocess.Checkpoint(str(tmp_path / "checkpoint.jsonl"))
+    pending = _results()
+
+    reprocess.flush(collection, pending, checkpoint, "mongo", dry_run=False)
+    assert pending == []
+    assert len(collection.writes) == 1
+    assert checkpoint.done == {"64b000000000000000000001"}
+
+
+def test_flush_dry_run_writes_nothing(tmp_path):
+    collection = _Collection()
+    path = tmp_path / "checkpoint.jsonl"
+    checkpoint = reprocess.Checkpoint(str(path))
+    pending = _results()
+
+    reprocess.flush(collection, pending, checkpoint, "mongo", dry_run=True)
+    assert pending == []
+    assert collection.writes == []
+    assert checkpoint.done == set()
+    assert not path.exists()
@@ -0,0 +1,53 @@
+import time
+
+
+def test_slot_pool_capacity_and_release(state_db):
+    pool = state_db.SlotPool("test", capacity=2, per_owner=2)
+    assert pool.try_acquire("a", "job-1")
+    assert pool.try_acquire("b", "job-2")
+    assert not pool.try_acquire("c", "job-3")
+
+    pool.release("job-1")
+    assert pool.try_acquire("c", "job-3")
+    assert pool.usage() == {"b": 1, "c": 1}
+
+
+def test_slot_pool_per_owner_cap(state_db):
+    pool = state_db.SlotPool("test", capacity=4, per_owner=1)
+    assert pool.try_acquire("clinic", "job-1")
+    assert not pool.try_acquire("clinic", "job-2")
+    assert pool.try_acquire("patient", "job-3")
+
+
+def test_slot_pool_reserve(state_db):
+    pool = state_db.SlotPool("test", capacity=2, per_owner=2)
+    assert pool.try_acquire("clinic", "batch-1", reserve=1)
+    # The last slot is kept for callers that don't ask for a reserve
+    assert not pool.try_acquire("clinic", "batch-2", reserve=1)
+    assert pool.try_acquire("patient", "interactive-1")
+
+
+def test_slot_pool_leases_expire(state_db):
+    pool = state_db.SlotPool("test", capacity=1, per_owner=1, lease_seconds=-1)
+    assert pool.try_acquire("a", "job-1")
+    # The lease is already past its expiry, as if the worker had died
+    assert pool.try_acquire("b", "job-2")
+
+
+def test_slot_pool_acquire_times_out(state_db):
+    pool = state_db.SlotPool("test", capacity=1, per_owner=1)
+    assert pool.try_acquire("a", "job-1")
+    assert not pool.acquire("b", "job-2", timeout=0.2, poll_seconds=0.05)
+    pool.release("job-1")
+    assert pool.acquire("b", "job-2", timeout=0.2, poll_seconds=0.05)
+
+
+def test_record_submission_counts_per_tenant_window(state_db, monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(state_db.time, "time", lambda: now)
+    assert [state_db.record_submission("clinic", 600) for _ in range(3)] == [1, 2, 3]
+    assert state_db.record_submission("patient", 600) == 1
+
+    # Older submissions drop out of the window
+    monkeypatch.setattr(state_db.time, "time", lambda: now + 601)
+    assert state_db.record_submission("clinic", 600) == 1
@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfplumber
+from shared_state import SharedCache, SlotPool
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------
+# OCR Settings
+# ------------------------------
+# OCR is CPU heavy, so it runs in its own small process pool, never in the API workers.
+# Every API / Celery process has its own pool, so Tesseract runs are also capped
+# box-wide by OCR_BOX_MAX_WORKERS shared slots.
+OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", 2))
+OCR_BOX_MAX_WORKERS = int(os.getenv("OCR_BOX_MAX_WORKERS", OCR_MAX_WORKERS))
+# Render resolution and the largest side (in pixels) pages are downscaled to,
+# which keeps the CPU time per page predictable
+OCR_RESOLUTION = int(os.getenv("OCR_RESOLUTION", 200))
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", 2000))
+# Tesseract run time per page, and how long the caller waits for a whole document
+OCR_PAGE_TIMEOUT = int(os.getenv("OCR_PAGE_TIMEOUT", 60))
+OCR_DOC_TIMEOUT = int(os.getenv("OCR_DOC_TIMEOUT", 180))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+
+# Recognised text keyed by the hash of the (downscaled) page image
+ocr_cache = SharedCache("ocr", ttl=30 * 86400)
+
+# One owner: the slots only bound the total, there is no per-tenant share
+ocr_slots = SlotPool("ocr", capacity=OCR_BOX_MAX_WORKERS, per_owner=OCR_BOX_MAX_WORKERS,
+                     lease_seconds=OCR_PAGE_TIMEOUT * 2)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _init_worker():
+    # Lower the OCR workers' scheduling priority so the API stays responsive
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """
+    Lazily create the OCR pool (one per process, re-created after fork).
+    """
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(
+                max_workers=OCR_MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def _ocr_page(file_path: str, page_number: int, deadline: float):
+    """
+    Render one page, downscale it and run Tesseract on it (runs in the OCR pool).
+    Returns None when the page could not be recognised.
+    """
+    try:
+        import pytesseract
+    except ImportError:
+        logger.warning("pytesseract is not installed; skipping OCR.")
+        return None
+
+    with pdfplumber.open(file_path) as pdf:
+        image = pdf.pages[page_number].to_image(resolution=OCR_RESOLUTION).original
+
+    # Grayscale + downscale before recognition
+    image = image.convert("L")
+    image.thumbnail((OCR_MAX_SIDE, OCR_MAX_SIDE))
+
+    digest = hashlib.sha256(f"{image.size}:{OCR_LANG}".encode() + image.tobytes()).hexdigest()
+    cached = ocr_cache.get(digest)
+    if cached is not None:
+        return cached
+
+    holder = f"{os.getpid()}:{threading.get_ident()}"
+    if not ocr_slots.acquire("ocr", holder, timeout=max(0.0, deadline - time.time())):
+        logger.warning(f"No OCR slot free before the deadline for page {page_number + 1} of {file_path}")
+        return None
+    try:
+        text = pytesseract.image_to_string(image, lang=OCR_LANG, timeout=OCR_PAGE_TIMEOUT)
+    finally:
+        ocr_slots.release(holder)
+    ocr_cache.set(digest, text)
+    return text
+
+
+def ocr_pages(file_path: str, page_numbers: list) -> list:
+    """
+    OCR the given (0-based) pages of a PDF in the bounded pool, within
+    OCR_DOC_TIMEOUT for the whole document.
+    Pages that fail or time out come back as None; blank pages as "".
+    """
+    deadline = time.time() + OCR_DOC_TIMEOUT
+    executor = get_executor()
+    futures = [executor.submit(_ocr_page, file_path, n, deadline) for n in page_numbers]
+
+    texts = []
+    for page_number, future in zip(page_numbers, futures):
+        try:
+            texts.append(future.result(timeout=max(0.0, deadline - time.time())))
+        except Exception as e:
+            future.cancel()
+            logger.error(f"OCR failed for page {page_number + 1} of {file_path}: {e}")
+            texts.append(None)
+    return texts
@@ -3,11 +3,55 @@ from crewai.tools import BaseTool
 import os
 from langchain_community.document_loaders import PDFPlumberLoader
 import logging
+from shared_state import serper_limiter, search_cache
+from tools.ocr import ocr_pages
+from budget import current_budget
 
 # Set up logging for better debugging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+def extract_pdf_pages(file_path: str) -> tuple:
+    """
+    Extract the text of every page. Pages without a text layer (scanned
+    images) are sent to the OCR pool; pages that have text are never OCR'd.
+
+    Returns (pages, incomplete): `incomplete` lists the pages whose OCR failed
+    or timed out. Callers should not store such an extraction, so the document
+    is OCR'd again next time. A page OCR'd to empty text is just blank.
+    """
+    docs = PDFPlumberLoader(file_path).load()
+    pages = [(data.page_content or "").replace("\n\n", "\n") for data in docs]
+
+    incomplete = []
+    missing = [i for i, content in enumerate(pages) if not content.strip()]
+    if missing:
+        logger.info(f"No text layer on {len(missing)} page(s) of {file_path}, falling back to OCR")
+        for page_number, text in zip(missing, ocr_pages(file_path, missing)):
+            if text is None:
+                incomplete.append(page_number)
+                continue
+            pages[page_number] = text.replace("\n\n", "\n")
+
+    return pages, incomplete
+
+
+def format_report_text(pages: list, max_chars: int = 3000) -> str:
+    """
+    Join extracted pages into the report text given to the agents,
+    truncated to avoid token limits.
+    """
+    full_report = ""
+    for content in pages:
+        full_report += content + "\n"
+
+        if len(full_report) > max_chars:
+            full_report = full_report[:max_chars]
+            full_report += "\n\n[...TRUNCATED DUE TO SIZE LIMIT...]"
+            break
+    return full_report
+
+
 class BloodTestReportTool(BaseTool):
     name: str = "blood_test_report_tool"
     description: str = "Reads data from a PDF file and returns text (truncated to avoid token limits)."
@@ -15,20 +59,10 @@ class BloodTestReportTool(BaseTool):
 
     def _run(self, file_path: str) -> str:
         try:
-            docs = PDFPlumberLoader(file_path).load()
-            full_report = ""
-
-            for data in docs:
-                content = data.page_content or ""
-                content = content.replace("\n\n", "\n")
-                full_report += content + "\n"
-
-                if len(full_report) > self.MAX_CHARS:
-                    full_report = full_report[:self.MAX_CHARS]
-                    full_report += "\n\n[...TRUNCATED DUE TO SIZE LIMIT...]"
-                    break
+            pages, _ = extract_pdf_pages(file_path)
+            full_report = format_report_text(pages, self.MAX_CHARS)
 
-            if not full_report:
+            if not full_report.strip():
                 logger.error("No content extracted from the PDF.")
                 return "Error: No content extracted from the PDF."
 
@@ -82,6 +116,20 @@ def run_serper_search(query: str) -> str:
     if not api_key:
         return "Error: the SERPER_API_KEY environment variable is not set."
 
+    # Every search costs an agent round trip, so it counts against the request's budget
+    budget = current_budget.get()
+    if budget is not None and (budget.exhausted() or not budget.try_charge_tool()):
+        return "Error: the search budget for this report is used up. Answer with the information you already have."
+
+    # Shared across all workers, so repeated queries don't spend quota
+    cached = search_cache.get(query)
+    if cached is not None:
+        return cached
+
+    # Wait for a slot in the box-wide Serper quota
+    if not serper_limiter.acquire(timeout=30):
+        return "Error fetching results: search rate limit reached, try again later."
+
     url = "https://google.serper.dev/search"
     headers = {
         "X-API-KEY": api_key,
@@ -110,13 +158,17 @@ def run_serper_search(query: str) -> str:
         snippet = item.get("snippet", "")
         formatted.append(f"• **{title}**\n{snippet}\n{link}")
 
-    return "\n\n".join(formatted)
+    result = "\n\n".join(formatted)
+    search_cache.set(query, result)
+    return result
 
 
 # ===========================
 # EXPORTED SYMBOLS
 # ===========================
 __all__ = [
+    "extract_pdf_pages",
+    "format_report_text",
     "BloodTestReportTool",
     "ResearchSearchTool",
     "NutritionSearchTool",